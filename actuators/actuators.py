@@ -1,25 +1,182 @@
+import asyncio
+import json
+import os
 import random
 from abc import abstractmethod, ABC
 from time import sleep
 from threading import Thread
 import paho.mqtt.client as mqtt
+import requests
+from requests import RequestException
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
+import mqtt_asyncio
 
-def main():
-    for i in range(1, 5):
-        water_pump = WaterPump(i)
 
-    conditioner = Conditioner()
-    humidifier = AirHumidifier()
-    light = Lightbulb()
+# runtime is either 'threads' (mqtt loops in threads) or 'asyncio' (every actuator on one event loop)
+# connections is either 'shared' (one connection through the ActuatorHub) or 'per-actuator'
+def main(runtime='threads', connections='shared'):
+    if runtime == 'asyncio':
+        asyncio.run(main_async(connections))
+        return
+
+    start_actuators(connections)
+
+
+async def main_async(connections='shared'):
+    loop = asyncio.get_running_loop()
+    # the blocking fetch and its retries run in a worker thread, the hub keeps dispatching on the loop meanwhile
+    if connections == 'shared':
+        hub = ActuatorHub(loop=loop)
+        create_actuators(0, loop=loop, hub=hub)
+        hub.size(await loop.run_in_executor(None, fetch_plants))
+    else:
+        create_actuators(await loop.run_in_executor(None, get_plants), loop=loop)
+
+    # the actuators only react to mqtt messages, keep the loop alive forever
+    await asyncio.Event().wait()
+
+
+# The hub routes the conditioner, the humidifier and the lightbulb before the plant count is fetched, so their
+# commands are handled even when the config service does not answer, the water pumps are then sized by the
+# retained config/snapshot. Without the hub every pump needs its own connection, so the plant count is fetched
+# first and the process stops before opening any connection when the config service does not answer.
+def start_actuators(connections):
+    if connections == 'shared':
+        hub = ActuatorHub()
+        actuators = create_actuators(0, hub=hub)
+        hub.size(fetch_plants())
+        return actuators
+    return create_actuators(get_plants())
+
+
+# plant count, None when the config service does not answer
+def fetch_plants():
+    try:
+        return get_plants()
+    except RequestException as e:
+        print(f"Plants not fetched ({e}), water pumps are sized by config/snapshot")
+        return None
+
+
+@retry(retry=retry_if_exception_type(RequestException), wait=wait_exponential(multiplier=0.5, max=10),
+       stop=stop_after_attempt(8), reraise=True)
+def get_plants():
+    return requests.get("http://config:5008/config/sensors/moisture", timeout=5).json()['data']
+
+
+def create_actuators(plants, loop=None, hub=None):
+    actuators = [Conditioner(loop=loop, hub=hub), AirHumidifier(loop=loop, hub=hub), Lightbulb(loop=loop, hub=hub)]
+    if hub is None:
+        # every pump needs its own subscription without the hub, so they are all created upfront
+        actuators += [WaterPump(i, loop=loop) for i in range(1, plants + 1)]
+    else:
+        hub.resize(plants)
+    return actuators
+
+
+class ActuatorHub:
+    # Single mqtt connection shared by all the actuators: it subscribes to the wildcard topics of every
+    # actuator kind and dispatches each message through a routing table keyed by Actuator.route.
+    # Water pumps are sized from the config, resized when a new config is published on config/snapshot,
+    # and only created on the first command for their plant.
+
+    SUBSCRIPTIONS = ['waterpump/+/+', 'conditioner/#', 'humidifier/#', 'lightbulb', 'config/snapshot']
+
+    def __init__(self, loop=None):
+        self.client = mqtt.Client()
+        self.routes = {}
+        self.plants = 0
+        # set by the first config/snapshot, which is newer than the plant count fetched at start
+        self.configured = False
+        if loop is None:
+            thread = Thread(target=self.initialize_mqtt)
+            thread.start()
+        else:
+            self.initialize_mqtt_async(loop)
+
+    def initialize_mqtt(self):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect('mosquitto', 1883, 60)
+        self.client.loop_forever()
+
+    def initialize_mqtt_async(self, loop):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        mqtt_asyncio.connect(loop, self.client)
+
+    def register(self, actuator):
+        self.routes[actuator.route] = actuator
+
+    def unregister(self, actuator):
+        self.routes.pop(actuator.route, None)
+
+    def resize(self, plants):
+        if plants == self.plants:
+            return
+        removed = [a for a in list(self.routes.values()) if isinstance(a, WaterPump) and a.plant_id > plants]
+        for water_pump in removed:
+            self.unregister(water_pump)
+        print(f"Water pumps resized from {self.plants} to {plants} plants")
+        self.plants = plants
+
+    # plant count fetched at start, None when it could not be fetched
+    def size(self, plants):
+        if plants is not None and not self.configured:
+            self.resize(plants)
+
+    def on_config(self, msg):
+        config = json.loads(msg.payload)
+        self.configured = True
+        self.resize(config['data']['sensors']['moisture'])
+
+    def create(self, route):
+        # only water pumps of configured plants are created on demand
+        topic_split = route.split('/')
+        if topic_split[0] == 'waterpump' and len(topic_split) > 1 and topic_split[1].isdigit() \
+                and 1 <= int(topic_split[1]) <= self.plants:
+            return WaterPump(int(topic_split[1]), hub=self)
+        return None
+
+    # waterpump/<action>/<plant> is routed to waterpump/<plant>, every other topic to its first level
+    @staticmethod
+    def route(topic):
+        topic_split = str(topic).split('/')
+        if topic_split[0] == 'waterpump' and len(topic_split) > 2:
+            return f"waterpump/{topic_split[2]}"
+        return topic_split[0]
+
+    def on_connect(self, client, userdata, flags, rc):
+        self.client.subscribe([(topic, 0) for topic in self.SUBSCRIPTIONS])
+        print(f"Actuator hub connected and listening for {len(self.routes)} actuators")
+
+    def on_message(self, client, userdata, msg):
+        route = self.route(msg.topic)
+        if route == 'config':
+            self.on_config(msg)
+            return
+        actuator = self.routes.get(route) or self.create(route)
+        if actuator is not None:
+            actuator.on_message(client, userdata, msg)
 
 
 class Actuator(ABC):
 
-    def __init__(self):
+    # with a hub the actuator shares the hub connection, otherwise it opens its own:
+    # without a loop the mqtt client runs in its own thread, else it is driven by the given asyncio loop
+    def __init__(self, loop=None, hub=None):
+        if hub is not None:
+            self.client = hub.client
+            hub.register(self)
+            return
+
         self.client = mqtt.Client()
-        thread = Thread(target=self.initialize_mqtt)
-        thread.start()
+        if loop is None:
+            thread = Thread(target=self.initialize_mqtt)
+            thread.start()
+        else:
+            self.initialize_mqtt_async(loop)
 
     def initialize_mqtt(self):
         self.client.on_connect = self.on_connect
@@ -27,6 +184,17 @@ class Actuator(ABC):
         self.client.connect('mosquitto', 1883, 60)
         self.client.loop_forever()
 
+    def initialize_mqtt_async(self, loop):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        mqtt_asyncio.connect(loop, self.client)
+
+    # key of the actuator in the ActuatorHub routing table
+    @property
+    @abstractmethod
+    def route(self):
+        pass
+
     @abstractmethod
     def on_connect(self, client, userdata, flags, rc):
         pass
@@ -45,6 +213,7 @@ class Actuator(ABC):
 
 
 class Conditioner(Actuator):
+    route = 'conditioner'
 
     def increase(self):
         print(f'Increasing temperature')
@@ -70,9 +239,13 @@ class Conditioner(Actuator):
 
 class WaterPump(Actuator):
 
-    def __init__(self, plant_id):
-        super().__init__()
+    def __init__(self, plant_id, loop=None, hub=None):
         self.plant_id = plant_id
+        super().__init__(loop, hub)
+
+    @property
+    def route(self):
+        return f"waterpump/{self.plant_id}"
 
     def increase(self):
         print(f'Increasing moisture of plant {self.plant_id}')
@@ -96,6 +269,7 @@ class WaterPump(Actuator):
 
 
 class AirHumidifier(Actuator):
+    route = 'humidifier'
 
     def increase(self):
         print(f'Increasing humidity')
@@ -119,6 +293,8 @@ class AirHumidifier(Actuator):
             self.decrease()
 
 class Lightbulb(Actuator):
+    route = 'lightbulb'
+
     def on_connect(self, client, userdata, flags, rc):
         self.client.subscribe('lightbulb')
         print(f"Light connected and listening")
@@ -140,4 +316,4 @@ class Lightbulb(Actuator):
         self.client.publish(f'activate/light/off')
 
 if __name__ == '__main__':
-    main()
+    main(runtime=os.environ.get('RUNTIME', 'threads'), connections=os.environ.get('MQTT_CONNECTIONS', 'shared'))
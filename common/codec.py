@@ -0,0 +1,90 @@
+import json
+import struct
+from time import time
+
+PAYLOAD_FORMATS = ["text", "binary"]
+
+# Every message carries the sequence number of its stream (the topic it is published on) and the source
+# timestamp in ms of the tick it was read in, sequence numbers start from 1 when the publisher starts.
+# Text payloads are json: {"value", "seq", "ts"} per sensor and {"seq", "ts", "readings": {"<id>[/<plant_id>]": value}}
+# per batch, a bare number is still accepted as a reading without sequence number and timestamp.
+
+# Fixed width little endian payloads, the first byte tells the kind of payload so consumers can tell them
+# apart from the text payloads (a number or a json object never starts with these bytes).
+READING = 1
+BATCH = 2
+
+# kind, sensor id, sequence number, source timestamp in ms, value: 21 bytes per message on <measurement>/<id>[/<plant_id>]
+READING_STRUCT = struct.Struct('<BIIqf')
+# kind, sequence number, source timestamp in ms shared by the whole tick, number of records: 17 bytes per batch/<measurement>
+BATCH_HEADER = struct.Struct('<BIqI')
+# sensor id, plant id (0 for the sensors without a plant), value: 12 bytes per reading
+BATCH_RECORD = struct.Struct('<IIf')
+# values are float32, only their first 7 significant digits are meaningful
+DIGITS = 7
+
+
+def now_ms():
+    return int(time() * 1000)
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] in (READING, BATCH)
+
+
+def encode_reading(sensor_id, seq, value, timestamp=None):
+    return READING_STRUCT.pack(READING, sensor_id, seq, now_ms() if timestamp is None else timestamp, value)
+
+
+# (sensor id, sequence number, timestamp, value)
+def decode_reading(payload):
+    kind, sensor_id, seq, timestamp, value = READING_STRUCT.unpack(payload)
+    if kind != READING:
+        raise ValueError(f"Not a reading payload: {kind}")
+    return sensor_id, seq, timestamp, value
+
+
+# records are (sensor id, plant id, value), packed with a single struct format instead of one call per record
+def encode_batch(records, seq, timestamp=None):
+    records = list(records)
+    flat = [field for record in records for field in record]
+    header = BATCH_HEADER.pack(BATCH, seq, now_ms() if timestamp is None else timestamp, len(records))
+    return header + struct.pack(f"<{'IIf' * len(records)}", *flat)
+
+
+# (sequence number, timestamp, [(sensor id, plant id, value), ...])
+def decode_batch(payload):
+    kind, seq, timestamp, count = BATCH_HEADER.unpack_from(payload)
+    if kind != BATCH:
+        raise ValueError(f"Not a batch payload: {kind}")
+    if len(payload) != BATCH_HEADER.size + count * BATCH_RECORD.size:
+        raise ValueError(f"Batch of {count} records has {len(payload)} bytes")
+    return seq, timestamp, list(BATCH_RECORD.iter_unpack(memoryview(payload)[BATCH_HEADER.size:]))
+
+
+def encode_text_reading(value, seq, timestamp=None):
+    return json.dumps({"value": value, "seq": seq, "ts": now_ms() if timestamp is None else timestamp},
+                      separators=(',', ':'))
+
+
+# (sequence number, timestamp, value), sequence number and timestamp are None for a bare number
+def decode_text_reading(payload):
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    payload = payload.strip()
+    if not payload.startswith('{'):
+        return None, None, float(payload)
+    reading = json.loads(payload)
+    return reading["seq"], reading["ts"], float(reading["value"])
+
+
+# readings are {"<id>[/<plant_id>]": value}
+def encode_text_batch(readings, seq, timestamp=None):
+    return json.dumps({"seq": seq, "ts": now_ms() if timestamp is None else timestamp, "readings": readings},
+                      separators=(',', ':'))
+
+
+# (sequence number, timestamp, {"<id>[/<plant_id>]": value})
+def decode_text_batch(payload):
+    batch = json.loads(payload)
+    return batch["seq"], batch["ts"], batch["readings"]
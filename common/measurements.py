@@ -0,0 +1,3 @@
+# Kinds of sensor readings, in the order of their topics (<measurement>/<id>[/<plant_id>] and batch/<measurement>),
+# of the sensor types of the registry and of the influx measurements
+MEASUREMENTS = ["temperature", "humidity", "moisture", "light"]
@@ -0,0 +1,146 @@
+import asyncio
+import datetime
+import math
+import time
+from threading import Lock
+
+import numpy as np
+
+DAY = 24 * 60 * 60
+
+
+def daylight(now):
+    # maps the minute of the day on a sine wave going from 0 (midnight) to 255 (midday)
+    value = now.hour * 60 + now.minute  # 0 - 1440
+
+    mapped_value = np.interp(value, [0, 1440], [0, 360])
+
+    sin = math.sin(math.radians(mapped_value) + math.pi * (3 / 2))
+
+    return np.interp(sin, [-1, 1], [0, 255])
+
+
+class SimulationClock:
+    # Simulated time running `speed` times faster than real time from `start` (a datetime, now by default).
+    # Calling the clock returns the simulated seconds since it was created, so it replaces time.monotonic in the
+    # scheduler and the report filter, now() is the simulated datetime for the daylight and time_ms() the
+    # simulated timestamp of the readings. sleep() and sleep_async() wait the real time of simulated seconds.
+    # With speed 1 it behaves as the wall clock.
+
+    def __init__(self, speed=1, start=None):
+        if speed <= 0:
+            raise ValueError(f"Simulation speed must be positive, got {speed}")
+        self.speed = speed
+        self.start = datetime.datetime.now() if start is None else start
+        self.origin = time.monotonic()
+
+    def __call__(self):
+        return (time.monotonic() - self.origin) * self.speed
+
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self())
+
+    def time_ms(self):
+        return int((self.start.timestamp() + self()) * 1000)
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(seconds / self.speed)
+
+
+class GreenhouseModel:
+    # Lumped physical model of the greenhouse, integrated in fixed steps of `step` simulated seconds so the same
+    # seed and the same commands give the same trajectory whatever the speed of the clock:
+    # - the air temperature relaxes towards the outside temperature (a daily sine between 8 and 24 degrees,
+    #   warmest at 15:00) with a time constant of `insulation` seconds and is heated by the sun with the daylight
+    # - the air humidity relaxes towards the outside humidity (between 40 and 70%, driest at 15:00) with a time
+    #   constant of `ventilation` seconds and gains the water evaporated by the soil
+    # - the soil of every plant dries faster when it is hot, the air is dry and the soil is wet, each plant at
+    #   its own rate between 0.7 and 1.3 times the base rate, drawn from the seed and its plant id
+    # - a command does not move a value at once: an actuator delivers the same amount as the old fixed steps
+    #   (2 degrees, 10% humidity, 10% soil moisture) over `actuation` seconds, no longer than the cooldowns of
+    #   config.json: a command sent before the previous one is delivered overshoots and the control oscillates
+    # Soil moisture is passed in and returned as an array aligned with plant_ids, it lives in the sensor registry.
+
+    STEPS = {"temperature": 2, "humidity": 10, "moisture": 10}
+
+    def __init__(self, temperature, humidity, start, seed=0, step=5, insulation=3600, ventilation=1800,
+                 solar_gain=14, evaporation=24 / DAY, actuation=60):
+        self.temperature = float(temperature)
+        self.humidity = float(humidity)
+        self.start = start
+        self.seed = seed
+        self.step = step
+        self.insulation = insulation
+        self.ventilation = ventilation
+        # degrees above the outside temperature at full sun
+        self.solar_gain = solar_gain
+        # % of soil moisture per second at 20 degrees, 50% humidity and 50% moisture
+        self.evaporation = evaporation
+        self.actuation = actuation
+        self.time = 0.0
+        # [measurement, plant id (0 for the air), amount still to deliver]
+        self.actuators = []
+        self.lock = Lock()
+
+    # command of an actuator, action is 'increase' or 'decrease'
+    def actuate(self, measurement, action, plant_id=0):
+        amount = self.STEPS[measurement] if action == 'increase' else -self.STEPS[measurement]
+        with self.lock:
+            self.actuators.append([measurement, plant_id, float(amount)])
+
+    # drying rate of every plant, a hash of the seed and the plant id so it does not depend on the sensor order
+    def dryness(self, plant_ids):
+        hashed = (plant_ids.astype(np.uint64) * 2654435761 + self.seed * 40503) % 4294967296
+        return 0.7 + 0.6 * hashed / 4294967296
+
+    def outside(self, seconds):
+        # daily sine peaking at 15:00
+        day = seconds % DAY / DAY
+        wave = math.sin(2 * math.pi * (day - 9 / 24))
+        return 16 + 8 * wave, 55 - 15 * wave
+
+    # integrates up to `now` simulated seconds, returns the new soil moisture of the plants
+    def advance(self, now, moisture, plant_ids):
+        moisture = np.asarray(moisture, dtype=np.float64).copy()
+        plant_ids = np.asarray(plant_ids)
+        dryness = self.dryness(plant_ids)
+        offset = self.start.hour * 3600 + self.start.minute * 60 + self.start.second
+        dt = self.step
+        while self.time + dt <= now:
+            outside_temperature, outside_humidity = self.outside(offset + self.time)
+            sun = daylight(self.start + datetime.timedelta(seconds=self.time)) / 255
+
+            evaporated = 0.0
+            if len(moisture):
+                # +5% per degree above 20, proportional to the dryness of the air and the water in the soil
+                climate = max(0.0, 1 + 0.05 * (self.temperature - 20)) * (100 - self.humidity) / 50
+                rate = self.evaporation * dryness * climate * moisture / 50
+                moisture -= rate * dt
+                evaporated = float(rate.mean())
+
+            self.temperature += ((outside_temperature + self.solar_gain * sun - self.temperature) / self.insulation) * dt
+            self.humidity += ((outside_humidity - self.humidity) / self.ventilation + 2 * evaporated) * dt
+            self.deliver(moisture, plant_ids, dt)
+
+            self.temperature = min(max(self.temperature, -20.0), 60.0)
+            self.humidity = min(max(self.humidity, 0.0), 100.0)
+            np.clip(moisture, 0, 100, out=moisture)
+            self.time += dt
+        return moisture
+
+    def deliver(self, moisture, plant_ids, dt):
+        with self.lock:
+            for actuator in self.actuators:
+                measurement, plant_id, remaining = actuator
+                amount = math.copysign(min(abs(remaining), self.STEPS[measurement] / self.actuation * dt), remaining)
+                actuator[2] -= amount
+                if measurement == 'temperature':
+                    self.temperature += amount
+                elif measurement == 'humidity':
+                    self.humidity += amount
+                else:
+                    moisture[plant_ids == plant_id] += amount
+            self.actuators = [actuator for actuator in self.actuators if abs(actuator[2]) > 1e-9]
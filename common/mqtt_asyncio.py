@@ -0,0 +1,49 @@
+import asyncio
+
+import paho.mqtt.client as mqtt
+
+
+class AsyncioHelper:
+    # Runs a paho client on an asyncio event loop instead of a loop_forever() thread:
+    # the client socket is registered as a reader/writer of the loop and the periodic
+    # keepalive/reconnect work of loop_misc() runs as a task, so any number of clients
+    # can share the same thread.
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        if self.misc is None:
+            self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        while True:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    self.client.reconnect()
+                except OSError:
+                    pass
+            await asyncio.sleep(1)
+
+
+def connect(loop, client, host='mosquitto', port=1883, keepalive=60):
+    helper = AsyncioHelper(loop, client)
+    client.connect(host, port, keepalive)
+    return helper
@@ -0,0 +1,83 @@
+from bisect import bisect_left
+from time import time
+
+# upper bounds in ms of the publish to ingest latency buckets, the last bucket has no upper bound
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class StreamMonitor:
+    # Checks the sequence numbers and source timestamps of the messages of every stream (topic) a consumer
+    # receives. The next sequence number of a stream is expected to be the last one + 1:
+    # - higher: the messages in between were lost, counted as a gap and their number as missing
+    # - equal: the message was delivered twice
+    # - lower: the message arrived out of order, or the publisher restarted when it is 1 again
+    # Latencies (consumer clock - source timestamp) go in a histogram of LATENCY_BUCKETS.
+
+    def __init__(self, buckets=LATENCY_BUCKETS, clock=time):
+        self.buckets = buckets
+        self.clock = clock
+        self.last = {}
+        self.reset()
+
+    def reset(self):
+        self.counts = {"received": 0, "gaps": 0, "missing": 0, "duplicates": 0, "reordered": 0, "restarts": 0}
+        self.histogram = [0] * (len(self.buckets) + 1)
+        self.max_latency = 0
+
+    # returns 'ok', 'gap', 'duplicate', 'reordered', 'restart' or 'first' for the first message of a stream
+    def observe(self, stream, seq, timestamp=None, now=None):
+        self.counts["received"] += 1
+        if timestamp is not None:
+            now = self.clock() * 1000 if now is None else now
+            latency = max(0, now - timestamp)
+            self.histogram[bisect_left(self.buckets, latency)] += 1
+            self.max_latency = max(self.max_latency, latency)
+        if seq is None:
+            return 'ok'
+
+        last = self.last.get(stream)
+        if last is None:
+            self.last[stream] = seq
+            return 'first'
+        if seq == last + 1:
+            self.last[stream] = seq
+            return 'ok'
+        if seq > last:
+            self.counts["gaps"] += 1
+            self.counts["missing"] += seq - last - 1
+            self.last[stream] = seq
+            return 'gap'
+        if seq == last:
+            self.counts["duplicates"] += 1
+            return 'duplicate'
+        if seq == 1:
+            self.counts["restarts"] += 1
+            self.last[stream] = seq
+            return 'restart'
+        self.counts["reordered"] += 1
+        return 'reordered'
+
+    def forget(self, stream):
+        self.last.pop(stream, None)
+
+    # latency in ms under which p percent of the messages arrived, as the upper bound of its bucket
+    def percentile(self, p):
+        total = sum(self.histogram)
+        if not total:
+            return None
+        threshold = total * p / 100
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= threshold:
+                return self.buckets[i] if i < len(self.buckets) else self.max_latency
+        return self.max_latency
+
+    def stats(self):
+        return {
+            **self.counts,
+            "latency_ms": {"p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99),
+                           "max": self.max_latency},
+            "histogram": {f"<={bound}": count for bound, count in zip(self.buckets, self.histogram) if count}
+                         | ({f">{self.buckets[-1]}": self.histogram[-1]} if self.histogram[-1] else {}),
+        }
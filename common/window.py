@@ -0,0 +1,125 @@
+from collections import deque
+from time import monotonic
+
+
+class SlidingWindow:
+    # Aggregates of the samples received in the last `window` seconds.
+    # Samples are kept in a ring buffer that doubles when full, the sum is updated on every add/expire and
+    # min/max come from two monotonic deques of (sample number, value), so every sample is added and expired
+    # once and the aggregates are O(1) without re-scanning the history.
+
+    def __init__(self, window=60, capacity=16, clock=monotonic):
+        self.window = window
+        self.clock = clock
+        self.times = [0.0] * capacity
+        self.values = [0.0] * capacity
+        # number of the oldest sample in the window and of the next sample, the ring position is number % capacity
+        self.first = 0
+        self.next = 0
+        self.sum = 0.0
+        self.last = None
+        self.mins = deque()
+        self.maxs = deque()
+
+    def __len__(self):
+        return self.next - self.first
+
+    def add(self, value, now=None):
+        now = self.clock() if now is None else now
+        self.expire(now)
+        if len(self) == len(self.values):
+            self._grow()
+
+        position = self.next % len(self.values)
+        self.times[position] = now
+        self.values[position] = value
+        self.sum += value
+        self.last = value
+
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((self.next, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((self.next, value))
+        self.next += 1
+
+    def expire(self, now=None):
+        now = self.clock() if now is None else now
+        start = now - self.window
+        while self.first < self.next and self.times[self.first % len(self.times)] <= start:
+            self.sum -= self.values[self.first % len(self.values)]
+            self.first += 1
+        while self.mins and self.mins[0][0] < self.first:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0][0] < self.first:
+            self.maxs.popleft()
+        if self.first == self.next:
+            # no drift from the running sum once the window is empty
+            self.sum = 0.0
+
+    @property
+    def mean(self):
+        return self.sum / len(self) if len(self) else None
+
+    @property
+    def min(self):
+        return self.mins[0][1] if self.mins else None
+
+    @property
+    def max(self):
+        return self.maxs[0][1] if self.maxs else None
+
+    def aggregates(self, now=None):
+        self.expire(now)
+        return {"mean": self.mean, "min": self.min, "max": self.max, "last": self.last, "count": len(self)}
+
+    def _grow(self):
+        capacity = len(self.values)
+        start = self.first % capacity
+        self.times = self.times[start:] + self.times[:start] + [0.0] * capacity
+        self.values = self.values[start:] + self.values[:start] + [0.0] * capacity
+        # renumber the samples so that the ring positions match the new capacity
+        offset = self.first
+        self.mins = deque((number - offset, value) for number, value in self.mins)
+        self.maxs = deque((number - offset, value) for number, value in self.maxs)
+        self.next -= offset
+        self.first = 0
+
+
+class WindowAggregator:
+    # One SlidingWindow per key, e.g. (measurement, 'sensor', sensor_id) or (measurement, 'plant', plant_id).
+    # Keys updated since the last call to changed() are tracked, so the aggregates can be pushed incrementally.
+
+    def __init__(self, window=60, clock=monotonic):
+        self.window = window
+        self.clock = clock
+        self.windows = {}
+        self.dirty = set()
+
+    def __contains__(self, key):
+        return key in self.windows
+
+    def add(self, key, value, now=None):
+        if key not in self.windows:
+            self.windows[key] = SlidingWindow(self.window, clock=self.clock)
+        self.windows[key].add(value, now)
+        self.dirty.add(key)
+        return self.windows[key]
+
+    def get(self, key, now=None):
+        if key not in self.windows:
+            return None
+        return self.windows[key].aggregates(now)
+
+    def discard(self, key):
+        self.windows.pop(key, None)
+        self.dirty.discard(key)
+
+    # aggregates of the keys updated since the last call
+    def changed(self, now=None):
+        dirty, self.dirty = self.dirty, set()
+        return {key: self.windows[key].aggregates(now) for key in dirty if key in self.windows}
+
+    def snapshot(self, now=None):
+        return {key: window.aggregates(now) for key, window in self.windows.items()}
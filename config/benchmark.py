@@ -0,0 +1,57 @@
+import http.client
+import sys
+import time
+from threading import Thread
+from urllib.parse import urlparse
+
+
+# Load test of the config service: every client thread keeps one connection open and sends requests
+# for the whole duration, then the requests/sec and latency percentiles of all the clients are reported.
+
+def client(url, duration, latencies, errors):
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', parsed.path)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            connection.close()
+            connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+            continue
+        if response.status != 200:
+            errors.append(response.status)
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench_thresholds(base_url='http://config:5008', clients=16, duration=10):
+    print(f"GET /config/thresholds/<measurement>, {clients} clients, {duration}s")
+    for measurement in ['temperature', 'humidity', 'moisture']:
+        latencies = []
+        errors = []
+        threads = [Thread(target=client, args=(f"{base_url}/config/thresholds/{measurement}", duration, latencies, errors))
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        if not latencies:
+            print(f"{measurement:>12} | no successful requests, {len(errors)} errors")
+            continue
+        print(f"{measurement:>12} | {len(latencies) / duration:8.0f} req/s | "
+              f"p50 {percentile(latencies, 50) * 1000:6.2f} ms | p99 {percentile(latencies, 99) * 1000:6.2f} ms | "
+              f"{len(errors)} errors")
+
+
+if __name__ == '__main__':
+    bench_thresholds(*sys.argv[1:2])
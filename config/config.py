@@ -1,34 +1,135 @@
+import hashlib
 import json
-from threading import Thread
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+from threading import Lock, Thread
+from time import sleep
 
+import paho.mqtt.client as mqtt
 import requests
 from flask import Flask
 from flask import jsonify
+from flask import request
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 app.secret_key = 'B;}}S5Cx@->^^"hQT{T,GJ@YI*><17'
 
+Snapshot = namedtuple('Snapshot', ['data', 'version', 'etag', 'last_modified', 'mtime'])
+
+
+class ConfigStore:
+    # Keeps the parsed config.json in memory and parses it again only when the modification time of the
+    # file changes, so a request costs a stat() instead of an open() and a json.loads().
+    # Every snapshot carries a version number (the modification time in milliseconds, the same for every
+    # process reading the file) and the ETag and Last-Modified values used for conditional requests.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.snapshot = None
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None or os.stat(self.path).st_mtime_ns != snapshot.mtime:
+            with self.lock:
+                snapshot = self.load()
+        return snapshot
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if self.snapshot is not None and self.snapshot.mtime == mtime:
+            return self.snapshot
+
+        with open(self.path, 'r') as f:
+            content = f.read()
+
+        last_modified = datetime.fromtimestamp(mtime / 1e9, tz=timezone.utc)
+        self.snapshot = Snapshot(data=json.loads(content), version=mtime // 1_000_000,
+                                 etag=hashlib.sha1(content.encode()).hexdigest(),
+                                 last_modified=last_modified, mtime=mtime)
+        return self.snapshot
+
+
+class ConfigPublisher:
+    # Watches the config and publishes every new version as a retained message on config/snapshot,
+    # so that subscribers receive the current config as soon as they subscribe and every change after that.
+    # The payload has the same version and data fields as the /config/snapshot response.
+
+    def __init__(self, store, interval=1):
+        self.store = store
+        self.interval = interval
+        self.version = None
+        self.client = mqtt.Client()
+
+    def start(self):
+        self.client.connect_async('mosquitto', 1883, 60)
+        self.client.loop_start()
+        thread = Thread(target=self.watch, daemon=True)
+        thread.start()
+
+    def watch(self):
+        while True:
+            try:
+                self.publish(self.store.get())
+            except (OSError, ValueError) as e:
+                print(f"Could not read the config: {e}")
+            sleep(self.interval)
+
+    def publish(self, snapshot):
+        if snapshot.version == self.version:
+            return
+        payload = json.dumps({"version": snapshot.version, "data": snapshot.data}, separators=(',', ':'))
+        # qos 1 messages are queued by paho until the broker connection is up
+        self.client.publish('config/snapshot', payload, qos=1, retain=True)
+        self.version = snapshot.version
+        print(f"Published config version {snapshot.version}")
+
+
+config = ConfigStore('config.json')
+# parse the config at import time, gunicorn preloads the app and the workers inherit the parsed config
+config.get()
+
+
+def config_response(snapshot, data, **extra):
+    resp = jsonify(success=True, error="none", data=data, **extra)
+    resp.status_code = 200
+    resp.set_etag(snapshot.etag)
+    resp.last_modified = snapshot.last_modified
+    # answers 304 Not Modified when If-None-Match or If-Modified-Since match
+    return resp.make_conditional(request)
+
+
+# whole config in one call, e.g. to initialize a client with a single round trip
+@app.route("/config", methods=["GET"])
+@app.route("/config/snapshot", methods=["GET"])
+def get_config():
+    snapshot = config.get()
+    return config_response(snapshot, snapshot.data, version=snapshot.version)
+
 
 @app.route("/config/sensors/<measurement>", methods=["GET"])
 def get_sensors(measurement):
-    with open('config.json', 'r') as f:
-        sensors = json.loads(f.read())['sensors']
+    snapshot = config.get()
+    return config_response(snapshot, snapshot.data['sensors'][measurement])
 
-    resp = jsonify(success=True, error="none", data=sensors[measurement])
-    resp.status_code = 200
-    return resp
+
+@app.route("/config/intervals/<measurement>", methods=["GET"])
+def get_intervals(measurement):
+    snapshot = config.get()
+    return config_response(snapshot, snapshot.data['intervals'][measurement])
 
 
 @app.route("/config/thresholds/<measurement>", methods=["GET"])
 def get_thresholds(measurement):
-    with open('config.json', 'r') as f:
-        thresholds = json.loads(f.read())['thresholds']
-
-    resp = jsonify(success=True, error="none", data=thresholds[measurement])
-    resp.status_code = 200
-    return resp
+    snapshot = config.get()
+    return config_response(snapshot, snapshot.data['thresholds'][measurement])
 
 
+# development server, in production the app is served by gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
+    # the reloader runs the app in a child process, only that one publishes the config
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ConfigPublisher(config).start()
     app.run(debug=True, host='config', port=5008)
@@ -0,0 +1,26 @@
+import multiprocessing
+import os
+from threading import Lock
+
+# Production serving of the config service: several gunicorn workers with the debugger and the reloader off.
+# The app is preloaded in the master, so the parsed config is loaded once and shared by the forked workers.
+
+bind = os.environ.get('BIND', '0.0.0.0:5008')
+workers = int(os.environ.get('WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+preload_app = True
+keepalive = 5
+accesslog = None
+
+
+def when_ready(server):
+    # a single process, the master, publishes config changes on mqtt
+    from config import ConfigPublisher, config
+    ConfigPublisher(config).start()
+
+
+def post_fork(server, worker):
+    # the publisher thread of the master may hold the store lock while forking
+    from config import config
+    config.lock = Lock()
@@ -0,0 +1,197 @@
+import contextlib
+import datetime
+import io
+import json
+import random
+
+import numpy as np
+
+from codec import encode_text_reading
+from control import Controller, ControlService
+from model import GreenhouseModel
+
+
+# Closed loop of the controller and a simulated greenhouse on a fake clock: every sensor reads every 5s,
+# the greenhouse drifts away from the thresholds and every command moves it by the same step as
+# Greenhouse.on_message (temperature 2, humidity 10, moisture 10). One simulated hour per policy.
+# In the hovering scenario the values start on the lower thresholds, drift out slower than the noise and the
+# actuators deliver a fifth of their step, so the means hover on the thresholds where the hysteresis matters.
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedGreenhouse:
+    STEPS = {"conditioner": ("temperature", 2), "humidifier": ("humidity", 10), "waterpump": ("moisture", 10)}
+
+    # start and drift override the default values of some measurements, strength scales the steps
+    def __init__(self, plants, seed=0, start=None, drift=None, strength=1):
+        self.random = random.Random(seed)
+        start = {"temperature": 30.0, "humidity": 55.0, "moisture": 65.0, **(start or {})}
+        self.values = {("temperature", 0): start["temperature"], ("humidity", 0): start["humidity"]}
+        self.values.update({("moisture", plant): start["moisture"] for plant in range(1, plants + 1)})
+        # degrees, % and % per reading: the sun heats the greenhouse, the air and the soil dry out
+        self.drift = {"temperature": 0.05, "humidity": -0.1, "moisture": -0.15, **(drift or {})}
+        self.strength = strength
+        self.reversals = 0
+        self.last_action = {}
+
+    # the controller publishes on this client
+    def publish(self, topic, payload=None):
+        topic_split = topic.split('/')
+        measurement, step = self.STEPS[topic_split[0]]
+        key = (measurement, int(topic_split[2]) if len(topic_split) > 2 else 0)
+        step *= self.strength
+        self.values[key] += step if topic_split[1] == 'increase' else -step
+        if self.last_action.get(key) not in (None, topic_split[1]):
+            self.reversals += 1
+        self.last_action[key] = topic_split[1]
+
+    def readings(self):
+        for (measurement, plant), value in self.values.items():
+            self.values[(measurement, plant)] = value + self.drift[measurement] + self.random.choice([-1, 0, 1]) * 0.5
+            yield measurement, plant, self.values[(measurement, plant)]
+
+
+class ModelGreenhouse(SimulatedGreenhouse):
+    # the physical model of common/model.py: the values follow the weather, the sun and the evaporation of the
+    # soil and the commands are delivered by the actuators over time
+    ACTUATORS = {"conditioner": "temperature", "humidifier": "humidity", "waterpump": "moisture"}
+
+    def __init__(self, plants, clock, seed=0):
+        super().__init__(plants, seed)
+        self.clock = clock
+        self.model = GreenhouseModel(23, 55, start=datetime.datetime(2024, 6, 1), seed=seed)
+        self.plants = np.arange(1, plants + 1)
+        self.moisture = np.full(plants, 65.0)
+
+    def publish(self, topic, payload=None):
+        topic_split = topic.split('/')
+        plant = int(topic_split[2]) if len(topic_split) > 2 else 0
+        self.model.actuate(self.ACTUATORS[topic_split[0]], topic_split[1], plant)
+        key = (self.ACTUATORS[topic_split[0]], plant)
+        if self.last_action.get(key) not in (None, topic_split[1]):
+            self.reversals += 1
+        self.last_action[key] = topic_split[1]
+
+    def readings(self):
+        self.moisture = self.model.advance(self.clock(), self.moisture, self.plants)
+        yield "temperature", 0, self.model.temperature + self.random.gauss(0, 0.3)
+        yield "humidity", 0, self.model.humidity + self.random.gauss(0, 1)
+        for plant, value in zip(self.plants.tolist(), self.moisture.tolist()):
+            yield "moisture", plant, value + self.random.gauss(0, 0.5)
+
+
+# scenario holds the start, drift and strength of the SimulatedGreenhouse
+def simulate(config, plants=8, minutes=60, model=False, scenario=None, **policy):
+    clock = Clock()
+    greenhouse = ModelGreenhouse(plants, clock) if model else SimulatedGreenhouse(plants, **(scenario or {}))
+    controller = Controller(greenhouse, clock=clock, **policy)
+
+    out_of_range = 0
+    readings = 0
+    # times a controlled mean went out of range
+    excursions = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller.on_config(config)
+        for tick in range(minutes * 12):
+            clock.now = tick * 5.0
+            active = set(controller.active)
+            for measurement, plant, value in greenhouse.readings():
+                # 4 temperature and humidity sensors share the greenhouse value, one moisture sensor per plant
+                for sensor in range(4 if plant == 0 else 1):
+                    controller.add(measurement, plant * 10 + sensor, plant, value)
+                down, up = config['data']['thresholds'][measurement]
+                readings += 1
+                out_of_range += not down <= value <= up
+            excursions += len(controller.active.keys() - active)
+            controller.flush()
+
+    stats = controller.metrics.stats()
+    return stats['commands'] / minutes, greenhouse.reversals, out_of_range / readings, excursions
+
+
+def bench_policies(path='../config/config.json', plants=8, minutes=60):
+    with open(path) as f:
+        data = json.load(f)
+    config = {"version": 1, "data": data}
+    no_limits = {"version": 1, "data": {**data, "hysteresis": {}, "cooldowns": {}}}
+
+    # on the lower thresholds, drifting out by less than the ±0.5 noise of a reading
+    hovering = {"start": {measurement: down for measurement, (down, up) in data['thresholds'].items()},
+                "drift": {"temperature": -0.01, "humidity": -0.02, "moisture": -0.02},
+                "strength": 0.2}
+
+    policies = [
+        ("every reading, no limits", no_limits, {"cooldown": 0, "hysteresis": 0}),
+        ("60s cooldown only", no_limits, {"cooldown": 60, "hysteresis": 0}),
+        ("config.json hysteresis + cooldowns", config, {}),
+    ]
+    for scenario_name, scenario in [("drifting", None), ("hovering", hovering)]:
+        print(f"Control commands, {scenario_name} greenhouse, {plants} plants, {minutes} simulated minutes")
+        for name, policy_config, policy in policies:
+            per_minute, reversals, out_of_range, excursions = simulate(policy_config, plants, minutes,
+                                                                       scenario=scenario, **policy)
+            print(f"{name:>36} | {per_minute:7.1f} commands/min | {reversals:4} reversals | "
+                  f"{excursions:4} excursions | {out_of_range * 100:5.1f}% readings out of range")
+
+
+def bench_model(path='../config/config.json', plants=8, days=2):
+    # days of the physical model, the greenhouse overheats in the afternoon, cools down at night and the
+    # plants dry out at their own rate
+    with open(path) as f:
+        config = {"version": 1, "data": json.load(f)}
+
+    print(f"Control commands, physical model, {plants} plants, {days} simulated days")
+    per_minute, reversals, out_of_range, excursions = simulate(config, plants, days * 24 * 60, model=True)
+    print(f"{'config.json hysteresis + cooldowns':>36} | {per_minute:7.2f} commands/min | {reversals:4} reversals | "
+          f"{excursions:4} excursions | {out_of_range * 100:5.1f}% readings out of range")
+
+
+class Message:
+    def __init__(self, topic, payload=b''):
+        self.topic = topic
+        self.payload = payload
+
+
+def bench_service_clock(path='../config/config.json', plants=8, days=1):
+    # the ControlService fed as fast as it can take them with the timestamped readings of the model, as from
+    # sensors with a high SIMULATION_SPEED: with the source clock its windows and cooldowns follow the simulated
+    # time, with the local clock the whole simulated day fits in a few cooldowns
+    with open(path) as f:
+        config = {"version": 1, "data": json.load(f)}
+    start = datetime.datetime(2024, 6, 1).timestamp() * 1000
+
+    print(f"ControlService clocks, physical model, {plants} plants, {days} simulated day(s) as fast as possible")
+    for name in ['source', 'local']:
+        clock = Clock()
+        greenhouse = ModelGreenhouse(plants, clock)
+        service = ControlService(clock=name)
+        service.controller.client = greenhouse
+        out_of_range = 0
+        readings = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.on_message(None, None, Message('config/snapshot', json.dumps(config)))
+            for tick in range(days * 24 * 720):
+                clock.now = tick * 5.0
+                for measurement, plant, value in greenhouse.readings():
+                    payload = encode_text_reading(value, tick + 1, int(start + clock.now * 1000))
+                    for sensor in range(4 if plant == 0 else 1):
+                        topic = f"{measurement}/{plant * 10 + sensor}/{plant}" if plant else f"{measurement}/{sensor}"
+                        service.on_message(None, None, Message(topic, payload))
+                    down, up = config['data']['thresholds'][measurement]
+                    readings += 1
+                    out_of_range += not down <= value <= up
+        commands = service.controller.metrics.stats()['commands']
+        print(f"{name:>8} clock | {commands / (days * 24):6.2f} commands/simulated hour | "
+              f"{out_of_range / readings * 100:5.1f}% readings out of range")
+
+
+if __name__ == '__main__':
+    bench_policies()
+    bench_model()
+    bench_service_clock()
@@ -0,0 +1,286 @@
+import json
+import os
+import struct
+from threading import Lock
+from time import monotonic, sleep, time
+
+import paho.mqtt.client as mqtt
+
+from codec import decode_batch, decode_reading, decode_text_batch, decode_text_reading, is_binary
+from measurements import MEASUREMENTS
+from window import SlidingWindow, WindowAggregator
+
+
+# actuator topic prefix of every controlled measurement, light is driven from the dashboard
+ACTUATORS = {
+    "temperature": "conditioner",
+    "humidity": "humidifier",
+    "moisture": "waterpump",
+}
+
+
+class CommandMetrics:
+    # Commands sent and requests held back by the cooldowns, in total and per actuator.
+    # The commands of the last minute are counted with a sliding window.
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.minute = SlidingWindow(60, clock=clock)
+        self.commands = {}
+        self.suppressed = {}
+
+    def sent(self, actuator, now):
+        self.minute.add(1, now)
+        self.commands[actuator] = self.commands.get(actuator, 0) + 1
+
+    def held(self, actuator):
+        self.suppressed[actuator] = self.suppressed.get(actuator, 0) + 1
+
+    def commands_per_minute(self, now=None):
+        self.minute.expire(now)
+        return len(self.minute)
+
+    def stats(self, now=None):
+        return {
+            "commands_per_minute": self.commands_per_minute(now),
+            "commands": sum(self.commands.values()),
+            "suppressed": sum(self.suppressed.values()),
+            "per_actuator": {actuator: {"commands": self.commands.get(actuator, 0),
+                                        "suppressed": self.suppressed.get(actuator, 0)}
+                             for actuator in sorted(set(self.commands) | set(self.suppressed))},
+        }
+
+
+class Controller:
+    # Threshold control on the sensor stream, replaces the Node-RED automation loop that queried InfluxDB
+    # for the last minute of every measurement. Temperature and humidity are averaged over all their sensors,
+    # moisture per plant, exactly like the Flux queries did.
+    # The windows are keyed (measurement, 'all', 0), (measurement, 'sensor', sensor_id) and
+    # (measurement, 'plant', plant_id), only the 'all' and 'plant' ones are controlled.
+    #
+    # A key goes out of range when its mean crosses a threshold and stays out until the mean is back inside
+    # by the hysteresis band of its measurement, so a value hovering on a threshold does not toggle.
+    # While out of range, the actuator is commanded at most once per cooldown: the rolling mean needs about
+    # a window to show the effect of a command. Requests made during the cooldown are coalesced into one
+    # pending command per actuator, the last direction wins, sent by flush() when the cooldown expires and
+    # dropped if the value gets back in range first.
+    # Hysteresis and cooldowns come from the config next to the thresholds, with the defaults below.
+
+    def __init__(self, client, window=60, cooldown=60, hysteresis=0, clock=monotonic):
+        self.client = client
+        self.cooldown = cooldown
+        self.hysteresis = hysteresis
+        self.clock = clock
+        self.thresholds = {}
+        self.hysteresis_bands = {}
+        self.cooldowns = {}
+        self.config_version = None
+        self.aggregator = WindowAggregator(window, clock)
+        # key -> action of the keys currently out of range
+        self.active = {}
+        # actuator topic -> time of its last command and action waiting for the end of its cooldown
+        self.last_sent = {}
+        self.pending = {}
+        self.metrics = CommandMetrics(clock)
+
+    def on_config(self, config):
+        if config['version'] == self.config_version:
+            return
+        self.config_version = config['version']
+        self.thresholds = config['data']['thresholds']
+        self.hysteresis_bands = config['data'].get('hysteresis', {})
+        self.cooldowns = config['data'].get('cooldowns', {})
+        # removed plants must not keep their moisture mean alive
+        plants = config['data']['sensors']['moisture']
+        for key in [k for k in self.aggregator.windows if k[0] == 'moisture' and k[1] == 'plant' and k[2] > plants]:
+            self.aggregator.discard(key)
+            self.active.pop(key, None)
+            self.pending.pop(self.actuator(key), None)
+        print(f"Loaded thresholds of config version {self.config_version}: {self.thresholds}, "
+              f"hysteresis: {self.hysteresis_bands}, cooldowns: {self.cooldowns}")
+
+    # plant_id is 0 for the sensors that are not bound to a plant
+    def add(self, measurement, sensor_id, plant_id, value, now=None):
+        now = self.clock() if now is None else now
+        self.aggregator.add((measurement, 'sensor', sensor_id), value, now)
+        key = (measurement, 'plant', plant_id) if plant_id else (measurement, 'all', 0)
+        self.check(key, self.aggregator.add(key, value, now).mean, now)
+
+    @staticmethod
+    def actuator(key):
+        measurement, _, plant_id = key
+        return f"{ACTUATORS[measurement]}/{plant_id}" if plant_id else ACTUATORS[measurement]
+
+    def check(self, key, mean, now):
+        measurement = key[0]
+        if measurement not in ACTUATORS or measurement not in self.thresholds:
+            return
+        down, up = self.thresholds[measurement]
+        band = self.hysteresis_bands.get(measurement, self.hysteresis)
+
+        action = self.active.get(key)
+        if action == 'increase' and mean >= down + band or action == 'decrease' and mean <= up - band:
+            action = None
+        if mean < down:
+            action = 'increase'
+        elif mean > up:
+            action = 'decrease'
+
+        if action is None:
+            if self.active.pop(key, None) is not None:
+                print(f"{measurement} back in range for {self.actuator(key)}: {mean:.1f}")
+            self.pending.pop(self.actuator(key), None)
+            return
+        self.active[key] = action
+        self.request(key, action, now)
+
+    def request(self, key, action, now):
+        actuator = self.actuator(key)
+        cooldown = self.cooldowns.get(key[0], self.cooldown)
+        if now - self.last_sent.get(actuator, float('-inf')) < cooldown:
+            if actuator not in self.pending:
+                self.metrics.held(actuator)
+            self.pending[actuator] = (key, action)
+            return
+        self.pending.pop(actuator, None)
+        self.last_sent[actuator] = now
+        self.command(key, action, now)
+
+    # sends the coalesced commands whose cooldown has expired
+    def flush(self, now=None):
+        now = self.clock() if now is None else now
+        for actuator, (key, action) in list(self.pending.items()):
+            if now - self.last_sent[actuator] >= self.cooldowns.get(key[0], self.cooldown):
+                del self.pending[actuator]
+                self.last_sent[actuator] = now
+                self.command(key, action, now)
+
+    def command(self, key, action, now):
+        measurement, _, plant_id = key
+        down, up = self.thresholds[measurement]
+        mean = self.aggregator.windows[key].mean
+        topic = f"{ACTUATORS[measurement]}/{action}"
+        if plant_id:
+            topic += f"/{plant_id}"
+        print(f"Topic: {topic}, Measurement: {measurement}, Value: {mean:.1f}, Up: {up}, Down: {down}")
+        self.metrics.sent(self.actuator(key), now)
+        self.client.publish(topic, "")
+
+
+class SourceClock:
+    # Time of the readings in seconds: the latest source timestamp received, so the windows and the cooldowns
+    # follow the simulated time of the sensors whatever their SIMULATION_SPEED. Readings without a timestamp
+    # advance it with the local time. It never goes back, restart control after restarting the sensors from an
+    # earlier SIMULATION_START.
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def observe(self, timestamp):
+        self.now = max(self.now, time() if timestamp is None else timestamp / 1000)
+        return self.now
+
+
+class ControlService:
+    # source is either 'topics' (one message per sensor) or 'batch' (batch/<measurement> messages),
+    # it must match a PUBLISH_MODE of the sensors that publishes it.
+    # Every `interval` seconds the aggregates updated since the last push are published retained on
+    # aggregate/<measurement>, aggregate/<measurement>/sensor/<id> and aggregate/<measurement>/plant/<id>
+    # as {"mean", "min", "max", "last", "count"}, for the dashboards, the coalesced commands whose cooldown
+    # expired are sent and the command metrics are published retained on control/metrics.
+    # clock is either 'source' (windows and cooldowns follow the source timestamps of the readings, see
+    # SourceClock) or 'local' (the time the readings are received).
+
+    def __init__(self, source='topics', window=60, cooldown=60, hysteresis=0, interval=1, clock='source'):
+        self.source = source
+        self.interval = interval
+        self.client = mqtt.Client()
+        self.source_clock = SourceClock() if clock == 'source' else None
+        self.controller = Controller(self.client, window=window, cooldown=cooldown, hysteresis=hysteresis,
+                                     clock=self.source_clock or monotonic)
+        self.lock = Lock()
+
+    def run(self):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect('mosquitto', 1883, 60)
+        self.client.loop_start()
+        last_report = monotonic()
+        while True:
+            sleep(self.interval)
+            with self.lock:
+                self.controller.flush()
+                metrics = self.controller.metrics.stats()
+            self.publish_aggregates()
+            self.client.publish('control/metrics', json.dumps(metrics, separators=(',', ':')), retain=True)
+            if monotonic() - last_report >= 60:
+                last_report = monotonic()
+                print(f"Commands in the last minute: {metrics['commands_per_minute']}, total: {metrics['commands']}, "
+                      f"held back by cooldowns: {metrics['suppressed']}")
+
+    def publish_aggregates(self):
+        with self.lock:
+            changed = self.controller.aggregator.changed()
+        for (measurement, scope, id), aggregates in changed.items():
+            topic = f"aggregate/{measurement}" if scope == 'all' else f"aggregate/{measurement}/{scope}/{id}"
+            self.client.publish(topic, json.dumps(aggregates, separators=(',', ':')), retain=True)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if self.source == 'batch':
+            topics = [f"batch/{measurement}" for measurement in MEASUREMENTS]
+        else:
+            topics = ['temperature/+', 'humidity/+', 'moisture/+/+', 'light/+']
+        self.client.subscribe([(topic, 0) for topic in topics] + [('config/snapshot', 1)])
+        print(f"Control connected and listening on {topics}")
+
+    # temperature/<id>, humidity/<id>, moisture/<id>/<plant_id>, light/<id> or batch/<measurement>,
+    # with text or binary payloads
+    def on_message(self, client, userdata, msg):
+        topic_split = str(msg.topic).split('/')
+        with self.lock:
+            try:
+                if topic_split[0] == 'config':
+                    self.controller.on_config(json.loads(msg.payload))
+                elif topic_split[0] == 'batch' and is_binary(msg.payload):
+                    _, timestamp, records = decode_batch(msg.payload)
+                    now = self.observe(timestamp)
+                    for sensor_id, plant_id, value in records:
+                        self.controller.add(topic_split[1], sensor_id, plant_id, value, now)
+                elif topic_split[0] == 'batch':
+                    _, timestamp, readings = decode_text_batch(msg.payload)
+                    now = self.observe(timestamp)
+                    for key, value in readings.items():
+                        self.add(topic_split[1], key.split('/'), value, now)
+                elif is_binary(msg.payload):
+                    _, _, timestamp, value = decode_reading(msg.payload)
+                    self.add(topic_split[0], topic_split[1:], value, self.observe(timestamp))
+                else:
+                    _, timestamp, value = decode_text_reading(msg.payload)
+                    self.add(topic_split[0], topic_split[1:], value, self.observe(timestamp))
+                if self.source_clock is not None and topic_split[0] != 'config':
+                    # the source time may move by many seconds per message, the cooldowns are checked on every one
+                    self.controller.flush()
+            except (ValueError, IndexError, AttributeError, TypeError, KeyError, struct.error):
+                # a malformed or foreign payload must not stop the mqtt loop thread
+                print(f"Discarded malformed message on {msg.topic}")
+
+    # time of a reading for the controller, None lets it use its local clock
+    def observe(self, timestamp):
+        return self.source_clock.observe(timestamp) if self.source_clock is not None else None
+
+    # path is [sensor_id] or [sensor_id, plant_id]
+    def add(self, measurement, path, value, now=None):
+        plant_id = int(path[1]) if len(path) > 1 else 0
+        self.controller.add(measurement, int(path[0]), plant_id, float(value), now)
+
+
+if __name__ == '__main__':
+    ControlService(source=os.environ.get('SOURCE', 'topics'),
+                   window=float(os.environ.get('WINDOW', 60)),
+                   cooldown=float(os.environ.get('COOLDOWN', 60)),
+                   hysteresis=float(os.environ.get('HYSTERESIS', 0)),
+                   interval=float(os.environ.get('AGGREGATE_INTERVAL', 1)),
+                   clock=os.environ.get('CLOCK', 'source')).run()
@@ -0,0 +1,123 @@
+import contextlib
+import io
+import shutil
+import tempfile
+import timeit
+from time import monotonic, sleep
+
+from influx_standin import InfluxStandin
+from ingestion import BatchWriter, encode
+from wal import SegmentLog
+
+
+def bench_encode(n=100_000):
+    print("Line protocol encoding")
+    for measurement, path in [("temperature", ["12"]), ("moisture", ["57", "8"])]:
+        elapsed = timeit.timeit(lambda: encode(measurement, path, 42.5, 1700000000000), number=n)
+        print(f"{measurement:>12} | {n / elapsed:10.0f} points/s | {encode(measurement, path, 42.5, 1700000000000)}")
+
+
+def lines(n):
+    return [encode("moisture", [str(i), str(i)], i % 100, 1700000000000 + i) for i in range(n)]
+
+
+def bench_throughput(points=200_000, batch_sizes=(100, 1000, 5000), latency=0.002):
+    print(f"Writer throughput, {points} points, {latency * 1000:.0f} ms per write")
+    data = lines(points)
+    for batch_size in batch_sizes:
+        standin = InfluxStandin(latency=latency).start()
+        writer = BatchWriter(standin.url, "univaq", "iot", "token", batch_size=batch_size, flush_interval=0.05).start()
+        start = monotonic()
+        writer.add_many(data)
+        while standin.points < points:
+            sleep(0.001)
+        elapsed = monotonic() - start
+        writer.stop()
+        standin.shutdown()
+        print(f"{batch_size:>8} points/batch | {points / elapsed:10.0f} points/s | {standin.batches} writes")
+
+
+def bench_outage(rate=20_000, seconds=6, outage=(2, 4), retry_batches=100, wal=None):
+    queue = "write-ahead log" if wal is not None else f"retry queue of {retry_batches} batches"
+    print(f"Outage of {outage[1] - outage[0]}s at {rate} points/s, {queue}")
+    standin = InfluxStandin().start()
+    writer = BatchWriter(standin.url, "univaq", "iot", "token", batch_size=1000, flush_interval=0.1,
+                         retry_batches=retry_batches, max_backoff=0.5, queue=wal).start()
+    data = lines(rate // 10)
+    start = monotonic()
+    sent = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        while monotonic() - start < seconds:
+            elapsed = monotonic() - start
+            standin.status = 503 if outage[0] <= elapsed < outage[1] else 204
+            writer.add_many(data)
+            sent += len(data)
+            sleep(max(0.0, sent / rate - (monotonic() - start)))
+        standin.status = 204
+        writer.stop()
+        writer.send()
+    stats = writer.snapshot()
+    standin.shutdown()
+    print(f"sent {sent} | written {standin.points} | dropped {stats['dropped']} | retries {stats['retries']}")
+
+
+def bench_wal(points=500_000, batch_size=5000, replay_size=50_000):
+    print(f"Write-ahead log, {points} points in batches of {batch_size}")
+    data = lines(points)
+    batches = [data[i:i + batch_size] for i in range(0, points, batch_size)]
+    for sync in (False, True):
+        directory = tempfile.mkdtemp()
+        try:
+            log = SegmentLog(directory, sync=sync)
+            start = monotonic()
+            for batch in batches:
+                log.append(batch)
+            append = monotonic() - start
+            size = log.write_offset + (log.write_segment - min(log.maps)) * log.segment_size
+
+            # replay in bulk after a restart
+            log.close()
+            start = monotonic()
+            log = SegmentLog(directory)
+            reopen = monotonic() - start
+            start = monotonic()
+            replayed = 0
+            while len(log):
+                replay, token = log.peek(replay_size)
+                replayed += len(replay)
+                log.ack(token)
+            replay = monotonic() - start
+            log.close()
+        finally:
+            shutil.rmtree(directory)
+        print(f"{'sync' if sync else 'no sync':>8} | append {points / append:10.0f} points/s "
+              f"({size / append / 1e6:6.1f} MB/s) | reopen {reopen * 1000:6.1f} ms | "
+              f"replay {replayed / replay:10.0f} points/s")
+
+
+def bench_wal_budget(points=500_000, batch_size=5000):
+    directory = tempfile.mkdtemp()
+    try:
+        log = SegmentLog(directory, segment_size=1024 * 1024, max_bytes=8 * 1024 * 1024)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(0, points, batch_size):
+                log.append(lines(batch_size))
+        print(f"Write-ahead log budget of 8 MB: {len(log.maps)} segments, {log.nbytes() / 1e6:.1f} MB on disk, "
+              f"{len(log)} points kept, {log.dropped} dropped")
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_encode()
+    bench_throughput()
+    bench_outage()
+    bench_outage(retry_batches=10)
+    bench_wal()
+    bench_wal_budget()
+    wal_directory = tempfile.mkdtemp()
+    try:
+        bench_outage(wal=SegmentLog(wal_directory))
+    finally:
+        shutil.rmtree(wal_directory)
@@ -0,0 +1,69 @@
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+
+
+# Local stand-in for the influx v2 write api (POST /api/v2/write), to run the ingestion service and its
+# benchmark without influx. It counts the points it receives, `status` makes every write fail with that
+# code (e.g. 503 while influx is restarting) and `latency` delays every response.
+
+class InfluxStandin(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0):
+        super().__init__(address, WriteHandler)
+        self.latency = latency
+        self.status = 204
+        self.lock = Lock()
+        self.points = 0
+        self.batches = 0
+        self.lines = []
+        self.keep_lines = False
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class WriteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        if server.latency:
+            sleep(server.latency)
+        if not self.path.startswith('/api/v2/write') or not self.headers.get('Authorization', '').startswith('Token '):
+            self.reply(404 if not self.path.startswith('/api/v2/write') else 401)
+            return
+        if server.status != 204:
+            self.reply(server.status)
+            return
+
+        lines = body.decode().split('\n')
+        with server.lock:
+            server.points += len(lines)
+            server.batches += 1
+            if server.keep_lines:
+                server.lines.extend(lines)
+        self.reply(204)
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8086
+    standin = InfluxStandin(('0.0.0.0', port))
+    print(f"Influx write api stand-in listening on {standin.url}")
+    standin.serve_forever()
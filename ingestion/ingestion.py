@@ -0,0 +1,283 @@
+import json
+import math
+import os
+import struct
+from collections import deque
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep, time
+
+import paho.mqtt.client as mqtt
+import requests
+
+from codec import DIGITS, decode_batch, decode_reading, decode_text_batch, decode_text_reading, is_binary
+from measurements import MEASUREMENTS
+from sequence import StreamMonitor
+from wal import BatchQueue, SegmentLog
+
+
+# influx answers these when it is overloaded or restarting, every other 4xx means the batch itself is wrong
+RETRIABLE = {408, 429, 500, 502, 503, 504}
+
+
+# Same schema the Node-RED "influxdb out" nodes write: moisture is tagged with its plant, the other
+# measurements with their sensor, the reading is a float field called value, timestamps are in ms.
+# path is [sensor_id] or [sensor_id, plant_id] as in the topics and batch keys, digits limits the significant
+# digits of the value (the float32 values of binary payloads would otherwise be written as 120.12345886230469)
+def encode(measurement, path, value, timestamp, digits=None):
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    if measurement == 'moisture':
+        tags = f"plant_id={int(path[1])}"
+    else:
+        tags = f"sensor_id={int(path[0])}"
+    if digits is not None:
+        return f"{measurement},{tags} value={value:.{digits}g} {timestamp}"
+    return f"{measurement},{tags} value={value!r} {timestamp}"
+
+
+# summary/<measurement> entries of the sensors in report by exception mode, stored as <measurement>_summary
+# with the same tags and the min, mean, max and count fields
+def encode_summary(measurement, path, summary, timestamp):
+    minimum, mean, maximum, count = summary
+    if measurement == 'moisture':
+        tags = f"plant_id={int(path[1])}"
+    else:
+        tags = f"sensor_id={int(path[0])}"
+    return (f"{measurement}_summary,{tags} min={float(minimum)!r},mean={float(mean)!r},max={float(maximum)!r},"
+            f"count={int(count)}i {timestamp}")
+
+
+class BatchWriter:
+    # Buffers line protocol points and writes them to the influx v2 write api in batches, a batch is sent
+    # when it has batch_size points or when the oldest point waited flush_interval seconds.
+    # Backpressure: add() blocks while max_pending points are waiting to be batched, so a writer that cannot
+    # keep up slows down the mqtt loop instead of growing without limit.
+    # Batches go through a queue and are written in order: a BatchQueue of retry_batches batches in memory
+    # that drops the oldest batch when full, or a SegmentLog on disk that keeps them across outages and
+    # restarts and replays up to replay_size points per write. When a write fails with a connection error or
+    # a retriable status it is retried with exponential backoff, points rejected by influx (e.g. 400 bad line
+    # protocol) are dropped at once.
+
+    def __init__(self, url, org, bucket, token, batch_size=5000, flush_interval=1, max_pending=100_000,
+                 retry_batches=100, max_backoff=30, timeout=10, queue=None, replay_size=50_000):
+        self.write_url = f"{url}/api/v2/write"
+        self.params = {"org": org, "bucket": bucket, "precision": "ms"}
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Token {token}", "Content-Type": "text/plain; charset=utf-8"})
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.pending = deque()
+        self.condition = Condition()
+        self.queue = BatchQueue(retry_batches) if queue is None else queue
+        self.replay_size = replay_size
+        # failed attempts of the oldest batch in the queue and time of its next attempt
+        self.attempts = 0
+        self.next_attempt = 0.0
+        self.running = False
+        self.thread = None
+        self.stats_lock = Lock()
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "rejected": 0, "blocked": 0}
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    # flushes what is pending and stops the writer thread, batches that still fail are left in the queue
+    def stop(self, timeout=None):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def add(self, line):
+        self.add_many((line,))
+
+    def add_many(self, lines):
+        with self.condition:
+            for line in lines:
+                if len(self.pending) >= self.max_pending:
+                    self.count("blocked")
+                    while len(self.pending) >= self.max_pending and self.running:
+                        self.condition.wait()
+                self.pending.append(line)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def count(self, stat, n=1):
+        with self.stats_lock:
+            self.stats[stat] += n
+
+    def run(self):
+        while self.running or self.pending:
+            batch = self.take()
+            if batch:
+                self.queue.append(batch)
+            self.send()
+        self.send()
+
+    # waits for a full batch, at most flush_interval or until the next retry is due
+    def take(self):
+        with self.condition:
+            deadline = monotonic() + self.flush_interval
+            if len(self.queue):
+                deadline = min(deadline, self.next_attempt)
+            while len(self.pending) < self.batch_size and self.running:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+            self.condition.notify_all()
+            return batch
+
+    # writes the queued batches in order, stops at the first one that has to be retried later
+    def send(self):
+        while len(self.queue) and self.next_attempt <= monotonic():
+            lines, token = self.queue.peek(self.replay_size)
+            status = self.write(lines)
+            if status is None or status in RETRIABLE:
+                self.attempts += 1
+                self.next_attempt = monotonic() + min(self.max_backoff, 0.5 * 2 ** (self.attempts - 1))
+                self.count("retries")
+                print(f"Write of {len(lines)} points failed ({status}), attempt {self.attempts}")
+                return
+            self.queue.ack(token)
+            self.attempts = 0
+            if status >= 300:
+                self.count("rejected", len(lines))
+                print(f"Influx rejected {len(lines)} points ({status})")
+            else:
+                self.count("written", len(lines))
+                self.count("batches")
+
+    # status code of the write, None when influx cannot be reached
+    def write(self, lines):
+        try:
+            response = self.session.post(self.write_url, params=self.params, data="\n".join(lines).encode(),
+                                         timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        return response.status_code
+
+    def snapshot(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["pending"] = len(self.pending)
+        stats["queued"] = len(self.queue)
+        stats["dropped"] = self.queue.dropped
+        return stats
+
+
+class IngestionService:
+    # Replaces the Node-RED "Data Storage" tab: readings are encoded to line protocol as they arrive and
+    # written by the BatchWriter. source is either 'topics' (one message per sensor) or 'batch'
+    # (batch/<measurement> messages), it must match a PUBLISH_MODE of the sensors that publishes it.
+    # Points are written with the source timestamp of the reading. The sequence numbers and timestamps of the
+    # messages go through a StreamMonitor, its gaps, duplicates and publish to ingest latencies since the
+    # previous report are printed and published retained on ingestion/metrics every report_interval seconds.
+
+    def __init__(self, writer, source='topics', report_interval=10):
+        self.writer = writer
+        self.source = source
+        self.report_interval = report_interval
+        self.client = mqtt.Client()
+        self.monitor = StreamMonitor()
+        self.monitor_lock = Lock()
+
+    def run(self):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect('mosquitto', 1883, 60)
+        self.writer.start()
+        self.client.loop_start()
+
+        last = self.writer.snapshot()
+        while True:
+            sleep(self.report_interval)
+            stats = self.writer.snapshot()
+            rate = (stats["written"] - last["written"]) / self.report_interval
+            print(f"Written {rate:.0f} points/s, pending {stats['pending']}, waiting for retry {stats['queued']}, "
+                  f"dropped {stats['dropped']}, rejected {stats['rejected']}")
+            last = stats
+
+            with self.monitor_lock:
+                streams = self.monitor.stats()
+                self.monitor.reset()
+            latency = streams["latency_ms"]
+            print(f"Received {streams['received']} messages, {streams['gaps']} gaps ({streams['missing']} missing), "
+                  f"{streams['duplicates']} duplicates, {streams['reordered']} out of order, latency p50 "
+                  f"{latency['p50']} ms, p99 {latency['p99']} ms, max {latency['max']:.0f} ms")
+            self.client.publish('ingestion/metrics', json.dumps({"writer": stats, "streams": streams},
+                                                                separators=(',', ':')), retain=True)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if self.source == 'batch':
+            topics = [f"batch/{measurement}" for measurement in MEASUREMENTS]
+        else:
+            topics = [f"{measurement}/#" for measurement in MEASUREMENTS]
+        topics.append('summary/#')
+        self.client.subscribe([(topic, 0) for topic in topics])
+        print(f"Ingestion connected and listening on {topics}")
+
+    # <measurement>/<id>[/<plant_id>], batch/<measurement> or summary/<measurement>, readings are written with
+    # their source timestamp, summaries and bare numbers from older publishers are stamped on arrival
+    def on_message(self, client, userdata, msg):
+        received = time() * 1000
+        timestamp = int(received)
+        seq = None
+        topic_split = str(msg.topic).split('/')
+        try:
+            if topic_split[0] == 'batch' and is_binary(msg.payload):
+                seq, timestamp, records = decode_batch(msg.payload)
+                lines = [encode(topic_split[1], (sensor_id, plant_id), value, timestamp, DIGITS)
+                         for sensor_id, plant_id, value in records]
+            elif is_binary(msg.payload):
+                _, seq, timestamp, value = decode_reading(msg.payload)
+                lines = [encode(topic_split[0], topic_split[1:], value, timestamp, DIGITS)]
+            elif topic_split[0] == 'summary':
+                measurement = topic_split[1]
+                lines = [encode_summary(measurement, key.split('/'), summary, timestamp)
+                         for key, summary in json.loads(msg.payload).items()]
+            elif topic_split[0] == 'batch':
+                measurement = topic_split[1]
+                seq, timestamp, readings = decode_text_batch(msg.payload)
+                lines = [encode(measurement, key.split('/'), value, timestamp) for key, value in readings.items()]
+            else:
+                seq, source_timestamp, value = decode_text_reading(msg.payload)
+                if source_timestamp is not None:
+                    timestamp = source_timestamp
+                lines = [encode(topic_split[0], topic_split[1:], value, timestamp)]
+        except (ValueError, IndexError, AttributeError, TypeError, KeyError, struct.error):
+            print(f"Discarded malformed reading on {msg.topic}")
+            return
+        if seq is not None:
+            with self.monitor_lock:
+                self.monitor.observe(msg.topic, seq, timestamp, received)
+        self.writer.add_many(line for line in lines if line is not None)
+
+
+if __name__ == '__main__':
+    # with WAL_DIR the batches are kept on disk until influx has written them
+    queue = None
+    if os.environ.get('WAL_DIR'):
+        queue = SegmentLog(os.environ['WAL_DIR'],
+                           segment_size=int(os.environ.get('WAL_SEGMENT_MB', 16)) * 1024 * 1024,
+                           max_bytes=int(os.environ.get('WAL_MAX_MB', 512)) * 1024 * 1024)
+    writer = BatchWriter(os.environ.get('INFLUX_URL', 'http://influx:8086'),
+                         os.environ.get('INFLUX_ORG', 'univaq'),
+                         os.environ.get('INFLUX_BUCKET', 'iot'),
+                         os.environ.get('INFLUX_TOKEN', 'iotinfluxdbtoken'),
+                         batch_size=int(os.environ.get('BATCH_SIZE', 5000)),
+                         flush_interval=float(os.environ.get('FLUSH_INTERVAL', 1)),
+                         max_pending=int(os.environ.get('MAX_PENDING', 100_000)),
+                         retry_batches=int(os.environ.get('RETRY_BATCHES', 100)),
+                         queue=queue)
+    IngestionService(writer, source=os.environ.get('SOURCE', 'topics')).run()
@@ -0,0 +1,204 @@
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+
+# payload length, number of points and crc32 of the payload, a zero length marks the end of a segment
+HEADER = struct.Struct('<III')
+
+
+class BatchQueue:
+    # In memory queue of the batches waiting to be written, the oldest batch is dropped when it is full.
+    # Same interface as SegmentLog: append a batch, peek at the oldest points and ack them once written.
+
+    def __init__(self, max_batches=100):
+        self.batches = deque()
+        self.max_batches = max_batches
+        self.points = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.points
+
+    def append(self, lines):
+        if len(self.batches) >= self.max_batches:
+            dropped = self.batches.popleft()
+            self.points -= len(dropped)
+            self.dropped += len(dropped)
+            print(f"Retry queue full, dropped a batch of {len(dropped)} points")
+        self.batches.append(lines)
+        self.points += len(lines)
+
+    def peek(self, max_points):
+        return self.batches[0], len(self.batches[0])
+
+    def ack(self, token):
+        self.batches.popleft()
+        self.points -= token
+
+    def close(self):
+        pass
+
+
+class SegmentLog:
+    # Append-only write-ahead log of line protocol batches in memory mapped segment files of segment_size
+    # bytes (<number>.seg, preallocated with zeros). Every batch is a record: HEADER + the lines joined by
+    # newlines. Appends are copied into the mapped segment and, with sync, flushed to disk before returning.
+    # peek() reads the oldest unwritten records back, merging them up to max_points so a backlog is
+    # replayed in bulk, ack() moves the read position past them and saves it in the checkpoint file.
+    # Compaction: segments before the read position are deleted. The disk budget: when the segments exceed
+    # max_bytes the oldest one is deleted even if it was not written yet, and its points are counted as dropped.
+    # After a crash the log resumes from the checkpoint, so points written just before it may be written
+    # twice, which influx handles by overwriting the points with the same series and timestamp.
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_bytes=512 * 1024 * 1024, sync=True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.sync = sync
+        self.maps = {}
+        self.points = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+
+        numbers = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.seg'))
+        for number in numbers:
+            self.maps[number] = self._map(number)
+        if not self.maps:
+            self.maps[0] = self._map(0, segment_size)
+
+        self.read = self._load_checkpoint()
+        if self.read[0] not in self.maps:
+            self.read = (min(self.maps), 0)
+        for number in [n for n in self.maps if n < self.read[0]]:
+            self._delete(number)
+
+        # the write position is the end of the last valid record of the last segment, a torn record is cleared
+        self.write_segment = max(self.maps)
+        self.write_offset = 0
+        for end, _, _ in self._records(self.write_segment, 0):
+            self.write_offset = end
+        segment = self.maps[self.write_segment]
+        segment[self.write_offset:] = bytes(len(segment) - self.write_offset)
+
+        self.points = sum(points for number in sorted(self.maps) if number >= self.read[0]
+                          for _, points, _ in self._records(number, self.read[1] if number == self.read[0] else 0))
+        if self.points:
+            print(f"Write-ahead log has {self.points} points to replay")
+
+    def __len__(self):
+        return self.points
+
+    def append(self, lines):
+        payload = "\n".join(lines).encode()
+        size = HEADER.size + len(payload)
+        segment = self.maps[self.write_segment]
+        # a zero header must fit after the record to mark the end of the segment
+        if self.write_offset + size + HEADER.size > len(segment):
+            self._roll(size + HEADER.size)
+            segment = self.maps[self.write_segment]
+
+        offset = self.write_offset
+        segment[offset:offset + size] = HEADER.pack(len(payload), len(lines), zlib.crc32(payload)) + payload
+        self.write_offset += size
+        if self.sync:
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            segment.flush(start, self.write_offset - start)
+        self.points += len(lines)
+        self._enforce_budget()
+
+    # oldest unwritten lines, at least one record and at most max_points when there are more records
+    def peek(self, max_points):
+        lines = []
+        position = self.read
+        points = 0
+        number, offset = self.read
+        while number in self.maps:
+            for end, count, payload in self._records(number, offset):
+                if lines and points + count > max_points:
+                    return lines, (position, points)
+                lines.extend(payload.decode().split('\n'))
+                points += count
+                position = (number, end)
+            if number == self.write_segment:
+                break
+            number, offset = number + 1, 0
+        return lines, (position, points)
+
+    def ack(self, token):
+        position, points = token
+        self.read = position
+        self.points -= points
+        self._save_checkpoint()
+        for number in [n for n in self.maps if n < position[0]]:
+            self._delete(number)
+
+    def close(self):
+        for segment in self.maps.values():
+            segment.flush()
+            segment.close()
+        self.maps = {}
+
+    def nbytes(self):
+        return sum(len(segment) for segment in self.maps.values())
+
+    # (end offset, points, payload) of the valid records of a segment from offset
+    def _records(self, number, offset):
+        segment = self.maps[number]
+        while offset + HEADER.size <= len(segment):
+            length, points, crc = HEADER.unpack_from(segment, offset)
+            end = offset + HEADER.size + length
+            if length == 0 or end > len(segment):
+                return
+            payload = segment[offset + HEADER.size:end]
+            if zlib.crc32(payload) != crc:
+                return
+            yield end, points, payload
+            offset = end
+
+    def _roll(self, size):
+        self.maps[self.write_segment].flush()
+        self.write_segment += 1
+        self.write_offset = 0
+        self.maps[self.write_segment] = self._map(self.write_segment, max(self.segment_size, size))
+
+    def _enforce_budget(self):
+        while self.nbytes() > self.max_bytes and len(self.maps) > 1:
+            oldest = min(self.maps)
+            if oldest == self.read[0]:
+                dropped = sum(points for _, points, _ in self._records(oldest, self.read[1]))
+                self.points -= dropped
+                self.dropped += dropped
+                print(f"Write-ahead log over {self.max_bytes} bytes, dropped {dropped} points")
+                self.read = (oldest + 1, 0)
+                self._save_checkpoint()
+            self._delete(oldest)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _map(self, number, size=None):
+        path = self._path(f"{number:020d}.seg")
+        with open(path, 'a+b') as f:
+            if size is not None:
+                f.truncate(size)
+            return mmap.mmap(f.fileno(), 0)
+
+    def _delete(self, number):
+        self.maps.pop(number).close()
+        os.remove(self._path(f"{number:020d}.seg"))
+
+    def _load_checkpoint(self):
+        try:
+            with open(self._path('checkpoint')) as f:
+                number, offset = f.read().split()
+                return int(number), int(offset)
+        except (OSError, ValueError):
+            return -1, 0
+
+    def _save_checkpoint(self):
+        path = self._path('checkpoint')
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self.read[0]} {self.read[1]}")
+        os.replace(path + '.tmp', path)
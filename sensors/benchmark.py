@@ -0,0 +1,278 @@
+import contextlib
+import io
+import json
+import datetime
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import provisioning
+import templates
+from codec import decode_batch, decode_reading, decode_text_batch, decode_text_reading
+from dashboard_standin import DashboardStandin
+from greenhouse import Greenhouse
+from measurements import MEASUREMENTS
+from model import GreenhouseModel, SimulationClock
+from publisher import Publisher, ReportFilter
+from registry import SensorRegistry
+from scheduler import TickScheduler
+from simulation import ModelSimulation, VectorizedSimulation
+
+
+def build_registry(n):
+    registry = SensorRegistry()
+    for i in range(1, n + 1):
+        registry.add(i, 'moisture', plant_id=i, state=50)
+    return registry
+
+
+def measure(build, n):
+    tracemalloc.start()
+    result = build(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_registry_memory(sizes=(1_000, 10_000, 100_000)):
+    print("Sensor memory (moisture sensors)")
+    for n in sizes:
+        registry, registry_size = measure(build_registry, n)
+
+        # the object engine keeps the registry and one slotted object per sensor on top of it
+        greenhouse = Greenhouse.__new__(Greenhouse)
+        greenhouse.registry = registry
+        objects, objects_size = measure(lambda n: [greenhouse.create_sensor(id) for id in registry.ids.tolist()], n)
+
+        print(f"{n:>8} sensors | registry {registry_size / n:8.1f} B/sensor "
+              f"(fields and indexes {registry.bytes_per_sensor()} B/sensor) | objects +{objects_size / n:8.1f} B/sensor")
+
+
+class Message:
+    def __init__(self, topic, payload=b''):
+        self.topic = topic
+        self.payload = payload
+
+
+def bench_dispatch(sizes=(8, 100, 1_000, 10_000, 100_000), repeat=10_000):
+    print("Actuation dispatch latency (activate/moisture/increase/<plant>)")
+    for n in sizes:
+        greenhouse = Greenhouse.__new__(Greenhouse)
+        greenhouse.registry = build_registry(n)
+        greenhouse.registry.build_index()
+        messages = [Message(f"activate/moisture/increase/{plant}") for plant in range(1, n + 1, max(1, n // 100))]
+
+        # on_message logs every command, keep it out of the measurement output
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = timeit.timeit(lambda: [greenhouse.on_message(None, None, msg) for msg in messages], number=max(1, repeat // len(messages)))
+        calls = max(1, repeat // len(messages)) * len(messages)
+        print(f"{n:>8} plants | {elapsed / calls * 1e6:6.2f} us/command")
+
+
+def build_greenhouse(sensors):
+    greenhouse = Greenhouse.__new__(Greenhouse)
+    greenhouse.temperature, greenhouse.humidity, greenhouse.light_on = 23, 50, False
+    greenhouse.clock = SimulationClock()
+    greenhouse.registry = SensorRegistry()
+    for i in range(sensors):
+        measurement = MEASUREMENTS[i % len(MEASUREMENTS)]
+        greenhouse.registry.add(i + 1, measurement, plant_id=i // 4 + 1 if measurement == 'moisture' else 0,
+                                state=50 if measurement == 'moisture' else 0)
+    greenhouse.registry.build_index()
+    return greenhouse, VectorizedSimulation(greenhouse, greenhouse.registry, rng=np.random.default_rng(0))
+
+
+def bench_reporting(sensors=10_000, ticks=720, path='../config/config.json'):
+    # one simulated hour of 5s ticks of the numpy engine, all the readings vs report by exception
+    with open(path) as f:
+        reporting = json.load(f)['reporting']
+    greenhouse, simulation = build_greenhouse(sensors)
+    report_filter = ReportFilter(reporting, clock=lambda: 0)
+
+    received = {measurement: 0 for measurement in MEASUREMENTS}
+    reported = {measurement: 0 for measurement in MEASUREMENTS}
+    summaries = 0
+    elapsed = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tick in range(ticks):
+            readings = list(simulation.step())
+            start = time.perf_counter()
+            filtered = report_filter.filter(readings, now=tick * 5)
+            summaries += len(report_filter.summaries(now=tick * 5))
+            elapsed += time.perf_counter() - start
+            for topic, _ in readings:
+                received[topic.partition('/')[0]] += 1
+            for topic, _ in filtered:
+                reported[topic.partition('/')[0]] += 1
+
+    print(f"Report by exception, {sensors} sensors, {ticks} ticks, deadbands {reporting['deadbands']}, "
+          f"heartbeat {reporting['heartbeat']}s")
+    for measurement in MEASUREMENTS:
+        print(f"{measurement:>12} | {reported[measurement]:8} of {received[measurement]:8} readings published "
+              f"({reported[measurement] / received[measurement] * 100:5.1f}%)")
+    total = sum(received.values())
+    print(f"{'total':>12} | {sum(reported.values()) / total * 100:5.1f}% published, {summaries} summary messages, "
+          f"filter {elapsed / total * 1e6:.2f} us/reading")
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload=None):
+        self.messages.append((topic, payload))
+
+
+def decode_text(topic, payload):
+    return decode_text_batch(payload) if topic.startswith('batch/') else decode_text_reading(payload)
+
+
+def decode_binary(topic, payload):
+    return decode_batch(payload) if topic.startswith('batch/') else decode_reading(payload)
+
+
+def bench_payloads(sensors=10_000, repeat=5):
+    # one tick of every sensor of the numpy engine, light values are numpy floats with long decimal expansions
+    print(f"Payloads of one tick of {sensors} sensors")
+    _, simulation = build_greenhouse(sensors)
+    readings = list(simulation.step())
+    for mode in ['topics', 'batch']:
+        for payload_format, decode in [('text', decode_text), ('binary', decode_binary)]:
+            client = Recorder()
+            publisher = Publisher(client, mode=mode, payload_format=payload_format)
+            encode = timeit.timeit(lambda: publisher.publish(readings), number=repeat) / repeat
+            messages = client.messages[:len(client.messages) // repeat]
+            payload_bytes = sum(len(str(p)) if not isinstance(p, bytes) else len(p) for _, p in messages)
+            # mqtt publish packet: fixed header, topic length and topic, then the payload
+            wire_bytes = payload_bytes + sum(2 + 2 + len(topic) for topic, _ in messages)
+            payloads = [(t, p if isinstance(p, bytes) else str(p).encode()) for t, p in messages]
+            decoding = timeit.timeit(lambda: [decode(t, p) for t, p in payloads], number=repeat) / repeat
+            print(f"{mode:>7} {payload_format:>6} | {len(messages):6} messages | payloads {payload_bytes:8} B | "
+                  f"wire {wire_bytes:8} B | encode {encode * 1000:7.2f} ms | decode {decoding * 1000:7.2f} ms")
+
+
+def bench_rendering(plants=(100, 1_000), repeat=10):
+    print("Rendering of the per-plant nodes and panels")
+    for n in plants:
+        flow = timeit.timeit(lambda: templates.render_flow(n), number=repeat) / repeat
+        dashboard = timeit.timeit(lambda: templates.render_dashboard(n), number=repeat) / repeat
+        cache = provisioning.RenderCache()
+        cache.get('flow', 1, lambda: templates.render_flow(n))
+        cached = timeit.timeit(lambda: cache.get('flow', 1, lambda: templates.render_flow(n)), number=repeat) / repeat
+        print(f"{n:>8} plants | flow {flow * 1000:7.2f} ms ({len(templates.render_flow(n)) / 1e6:5.2f} MB) | "
+              f"dashboard {dashboard * 1000:7.2f} ms ({len(templates.render_dashboard(n)) / 1e6:5.2f} MB) | "
+              f"cached {cached * 1e6:5.2f} us")
+
+
+def bench_provisioning(plants=1_000, latency=0.005):
+    # Node-RED, Grafana and influx stand-in with latency seconds per request, a restart starts with an empty render cache
+    print(f"Provisioning of {plants} plants, {latency * 1000:.0f} ms per request")
+    standin = DashboardStandin(latency=latency).start()
+    provisioning.NODERED_URL = provisioning.GRAFANA_URL = provisioning.INFLUX_URL = standin.url
+
+    def config(version, moisture):
+        return {"version": version, "data": {"sensors": {"moisture": moisture}}}
+
+    steps = [
+        ("first start", config(1, plants), True),
+        ("same config", config(1, plants), False),
+        ("restart", config(1, plants), True),
+        ("new thresholds", config(2, plants), False),
+        ("one more plant", config(3, plants + 1), False),
+    ]
+    for name, snapshot, restart in steps:
+        if restart:
+            provisioning.cache = provisioning.RenderCache()
+        standin.reset_counters()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            provisioning.provision(snapshot)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16} | {elapsed * 1000:8.1f} ms | {standin.requests} requests, {standin.writes} writes, "
+              f"{standin.received / 1e6:5.2f} MB sent")
+    standin.shutdown()
+
+
+def bench_scheduler(sensors=10_000, interval=0.1, seconds=5):
+    # real ticks publishing every sensor of the numpy engine, the work takes a good part of the period and
+    # every 20th tick is stalled for 2.5 periods: the deadlines stay on the grid (no drift) and the ticks
+    # missed by a stall are counted as overruns instead of being published in a burst
+    print(f"Tick cadence, {sensors} sensors, {interval * 1000:.0f} ms period, {seconds} s")
+    _, simulation = build_greenhouse(sensors)
+    publisher = Publisher(Recorder())
+    scheduler = TickScheduler({measurement: interval for measurement in MEASUREMENTS})
+    start = scheduler.clock()
+    work = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        while scheduler.clock() - start < seconds:
+            due = scheduler.wait()
+            begin = time.perf_counter()
+            publisher.client.messages.clear()
+            publisher.publish(simulation.step(due))
+            if 'temperature' in due and scheduler.ticks['temperature'] % 20 == 0:
+                time.sleep(interval * 2.5)
+            work += time.perf_counter() - begin
+    elapsed = scheduler.clock() - start
+    for measurement, stats in scheduler.stats().items():
+        drift = scheduler.deadlines[measurement] - start - (stats['ticks'] + stats['overruns']) * interval
+        print(f"{measurement:>12} | {stats['ticks']:4} ticks + {stats['overruns']:3} overruns of "
+              f"{elapsed / interval:5.0f} periods | max jitter {stats['max_jitter'] * 1000:6.2f} ms | "
+              f"drift {drift * 1000:6.3f} ms")
+    print(f"{'busy':>12} | {work / elapsed * 100:5.1f}% of the time")
+
+
+class SteppedClock(SimulationClock):
+    # simulated time moved by hand, as fast as the simulation can go
+    def __init__(self, start):
+        super().__init__(start=start)
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def run_model(plants, seconds, seed, interval=5, start=datetime.datetime(2024, 6, 1)):
+    greenhouse, _ = build_greenhouse(0)
+    greenhouse.clock = SteppedClock(start)
+    for plant in range(1, plants + 1):
+        greenhouse.registry.add(plant, 'moisture', plant_id=plant, state=65)
+    greenhouse.registry.add(plants + 1, 'temperature')
+    greenhouse.registry.add(plants + 2, 'humidity')
+    greenhouse.registry.add(plants + 3, 'light')
+    greenhouse.registry.build_index()
+    greenhouse.model = GreenhouseModel(23, 50, start=start, seed=seed)
+    simulation = ModelSimulation(greenhouse, greenhouse.registry, greenhouse.model, greenhouse.clock,
+                                 rng=np.random.default_rng(seed))
+    readings = []
+    for tick in range(seconds // interval):
+        greenhouse.clock.time = tick * interval
+        readings.append(list(simulation.step()))
+    return readings
+
+
+def bench_model(plants=(8, 1_000), days=1):
+    # one simulated day of 5s ticks of the model engine, the speed is how many times faster than real time it can run
+    print(f"Model engine, {days} simulated day(s) of 5s ticks")
+    for n in plants:
+        start = time.perf_counter()
+        readings = run_model(n, days * 86400, seed=1)
+        elapsed = time.perf_counter() - start
+        moisture = [value for topic, value in readings[-1] if topic.startswith('moisture/')]
+        print(f"{n:>8} plants | {elapsed:6.2f} s | {days * 86400 / elapsed:9.0f}x real time | "
+              f"moisture after {days} day(s) {min(moisture):5.1f} - {max(moisture):5.1f}%")
+    same = run_model(8, 3600, seed=1) == run_model(8, 3600, seed=1)
+    different = run_model(8, 3600, seed=1) != run_model(8, 3600, seed=2)
+    print(f"same seed, same readings: {same} | other seed, other readings: {different}")
+
+
+if __name__ == '__main__':
+    bench_registry_memory()
+    bench_dispatch()
+    bench_reporting()
+    bench_payloads()
+    bench_scheduler()
+    bench_rendering()
+    bench_provisioning()
+    bench_model()
@@ -0,0 +1,152 @@
+import json
+import re
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from urllib.parse import urlsplit
+
+
+# Local stand-in for the parts of the Node-RED admin api (GET /flows, GET/PUT /flow/<id>, POST /flow), of the
+# Grafana dashboard api (GET /api/dashboards/uid/<uid>, POST /api/dashboards/db) and of the influx v2 api (orgs,
+# buckets and tasks) used by provisioning.py, to run the provisioning and its benchmark without the containers.
+# It keeps what it receives in memory, counts the requests and the bytes received, and `latency` delays every
+# response.
+
+class DashboardStandin(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0):
+        super().__init__(address, AdminHandler)
+        self.latency = latency
+        self.lock = Lock()
+        # tab id -> tab with its nodes and configs
+        self.flows = {}
+        self.dashboards = {}
+        # influx buckets and tasks by id
+        self.buckets = {}
+        self.tasks = {}
+        self.requests = 0
+        self.received = 0
+        self.writes = 0
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.received = 0
+            self.writes = 0
+
+
+class AdminHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.count()
+        server = self.server
+        with server.lock:
+            if self.path == '/flows':
+                # flat list of every tab, node and config as Node-RED returns it
+                flat = []
+                for tab in server.flows.values():
+                    flat.append({k: v for k, v in tab.items() if k not in ('nodes', 'configs')})
+                    flat.extend({**node, "z": tab['id']} for node in tab['nodes'] + tab['configs'])
+                self.reply(200, flat)
+            elif self.path.startswith('/flow/') and self.path[6:] in server.flows:
+                self.reply(200, server.flows[self.path[6:]])
+            elif self.path.startswith('/api/dashboards/uid/') and self.path[20:] in server.dashboards:
+                self.reply(200, {"dashboard": server.dashboards[self.path[20:]]})
+            elif urlsplit(self.path).path == '/api/v2/orgs':
+                self.reply(200, {"orgs": [{"id": "org1", "name": "univaq"}]})
+            elif urlsplit(self.path).path == '/api/v2/buckets':
+                self.reply(200, {"buckets": list(server.buckets.values())})
+            elif urlsplit(self.path).path == '/api/v2/tasks':
+                self.reply(200, {"tasks": list(server.tasks.values())})
+            else:
+                self.reply(404, {"message": "Not found"})
+
+    def do_POST(self):
+        body = self.count()
+        server = self.server
+        with server.lock:
+            server.writes += 1
+            if self.path == '/flow':
+                id = f"tab{len(server.flows) + 1}"
+                server.flows[id] = {**body, "id": id}
+                self.reply(200, {"id": id})
+            elif self.path == '/api/dashboards/db':
+                dashboard = body['dashboard']
+                version = server.dashboards.get(dashboard['uid'], {}).get('version', 0) + 1
+                server.dashboards[dashboard['uid']] = {**dashboard, "version": version}
+                self.reply(200, {"status": "success", "uid": dashboard['uid'], "version": version})
+            elif self.path == '/api/v2/buckets':
+                id = f"bucket{len(server.buckets) + 1}"
+                server.buckets[id] = {**body, "id": id}
+                self.reply(201, server.buckets[id])
+            elif self.path == '/api/v2/tasks':
+                id = f"task{len(server.tasks) + 1}"
+                name = re.search(r'name: "([^"]+)"', body['flux']).group(1)
+                server.tasks[id] = {**body, "id": id, "name": name, "status": "active"}
+                self.reply(201, server.tasks[id])
+            else:
+                self.reply(404, {"message": "Not found"})
+
+    def do_PUT(self):
+        body = self.count()
+        server = self.server
+        with server.lock:
+            server.writes += 1
+            id = self.path[6:]
+            if self.path.startswith('/flow/') and id in server.flows:
+                server.flows[id] = {**body, "id": id}
+                self.reply(200, {"id": id})
+            else:
+                self.reply(404, {"message": "Not found"})
+
+    def do_PATCH(self):
+        body = self.count()
+        server = self.server
+        with server.lock:
+            server.writes += 1
+            kind, _, id = self.path[8:].partition('/')
+            items = {"buckets": server.buckets, "tasks": server.tasks}.get(kind)
+            if self.path.startswith('/api/v2/') and items is not None and id in items:
+                items[id].update(body)
+                self.reply(200, items[id])
+            else:
+                self.reply(404, {"message": "Not found"})
+
+    # request body as json, None when there is none
+    def count(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.latency:
+            sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.received += len(body)
+        return json.loads(body) if body else None
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1880
+    standin = DashboardStandin(('0.0.0.0', port))
+    print(f"Node-RED, Grafana and influx api stand-in listening on {standin.url}")
+    standin.serve_forever()
@@ -1,56 +1,164 @@
-import math
+import asyncio
+import json
+import os
 from tenacity import retry
 import random
 from abc import abstractmethod
 import datetime
 from threading import Thread
-from time import sleep
+from time import monotonic
 
+import numpy as np
 import paho.mqtt.client as mqtt
 import requests
-from numpy import interp
+
+import mqtt_asyncio
+from measurements import MEASUREMENTS
+from model import GreenhouseModel, SimulationClock, daylight
+from registry import SensorRegistry
+from provisioning import provision
+from publisher import Publisher, ReportFilter
+from scheduler import TickScheduler
+from simulation import ModelSimulation, VectorizedSimulation
 
 
 class Greenhouse:
     light = 0
-
-    def __init__(self, temperature, humidity):
+    light_on = False
+    model = None
+
+    # engine is either 'objects' (one object per sensor), 'numpy' (vectorized batch simulation) or 'model'
+    # (vectorized sensors reading the physical model of common/model.py, actuators act over time)
+    # publish_mode is either 'topics' (one message per sensor), 'batch' (one message per measurement) or 'both'
+    # runtime is either 'threads' (mqtt loop in its own thread) or 'asyncio' (mqtt and publishing on one event loop)
+    # report_mode is either 'all' (every reading of every tick) or 'exception' (readings that moved past the
+    # deadbands of the config reporting section, heartbeats and min/mean/max summaries)
+    # payload_format is either 'text' (bare values and json batches) or 'binary' (common/codec.py payloads)
+    # config is the snapshot returned by the config service, fetched when not given
+    # provisioner is called in a background thread with every config applied after the first one
+    # speed is how many times faster than real time the simulated time runs from start (a datetime, now by
+    # default): ticks, timestamps and daylight follow the simulated time, seed makes the random values repeatable
+    def __init__(self, temperature, humidity, config=None, engine='objects', publish_mode='topics', runtime='threads',
+                 report_mode='all', payload_format='text', provisioner=None, speed=1, seed=None, start=None):
 
         # initialize default values for humidity and temperature
         self.humidity = humidity
         self.temperature = temperature
 
-        # create sensors list
+        # create sensors registry, the list of sensor objects is only filled by the 'objects' engine
+        self.registry = SensorRegistry()
         self.sensors = []
+        self.simulation = None
+        self.clock = SimulationClock(speed, start)
+        if seed is not None:
+            random.seed(seed)
+
+        if config is None:
+            config = get_config()
 
         # create mqtt client for publishing and subscribing
         self.client = mqtt.Client()
-
-        # create thread for mqtt initialization to avoid blocking loop
-        thread = Thread(target=self.initialize_mqtt)
-        thread.start()
+        report_filter = ReportFilter(config['data'].get('reporting', {}), clock=self.clock) if report_mode == 'exception' else None
+        self.publisher = Publisher(self.client, mode=publish_mode, report_filter=report_filter,
+                                   payload_format=payload_format, clock=self.clock.time_ms)
+
+        if runtime == 'threads':
+            # create thread for mqtt initialization to avoid blocking loop
+            thread = Thread(target=self.initialize_mqtt)
+            thread.start()
+        # config snapshots pushed on config/snapshot are applied by the publishing loop between two ticks
+        self.config_version = config['version']
+        self.pending_config = None
+        self.provisioner = provisioner
+        counts = config['data']['sensors']
+        intervals = config['data']['intervals']
+
+        if engine == 'numpy':
+            self.simulation = VectorizedSimulation(outer=self, registry=self.registry, rng=np.random.default_rng(seed))
+        elif engine == 'model':
+            self.model = GreenhouseModel(temperature, humidity, start=self.clock.start, seed=seed or 0)
+            for measurement, cooldown in config['data'].get('cooldowns', {}).items():
+                if cooldown < self.model.actuation:
+                    print(f"Cooldown of {measurement} ({cooldown}s) is shorter than the {self.model.actuation}s "
+                          "the model actuators take, the control will overshoot")
+            self.simulation = ModelSimulation(outer=self, registry=self.registry, model=self.model, clock=self.clock,
+                                              rng=np.random.default_rng(seed))
 
         # creation of sensors
-        counter = 1
-
-        for measurement in ["temperature","humidity","moisture","light"]:
-            n = requests.get(f"http://config:5008/config/sensors/{measurement}").json()['data']
-            for i in range(1, n+1):
-                if measurement == "temperature":
-                    temp_sens = self.TemperatureSensor(id=counter, type='temperature', outer=self)
-                    self.sensors.append(temp_sens)
-                elif measurement == "humidity":
-                    humidity_sens = self.AirHumiditySensor(id=counter, type='humidity', outer=self)
-                    self.sensors.append(humidity_sens)
-                elif measurement == "moisture":
-                    soil_moist_sens = self.SoilMoistureSensor(id=counter, type='moisture', outer=self, plant_id=i)
-                    self.sensors.append(soil_moist_sens)
-                elif measurement == "light":
-                    light_sensor = self.LightSensor(id=counter, type='light', outer=self)
-                    self.sensors.append(light_sensor)
-                counter += 1
-
-        self.run()
+        self.next_id = 1
+        self.counts = {measurement: 0 for measurement in MEASUREMENTS}
+        for measurement in MEASUREMENTS:
+            for i in range(counts[measurement]):
+                self.add_sensor(measurement)
+
+        # index sensors by plant and type so that actuation does not scan the sensors
+        self.registry.build_index()
+
+        # every measurement is published with its own period
+        self.scheduler = TickScheduler(intervals, clock=self.clock, sleep=self.clock.sleep,
+                                       sleep_async=self.clock.sleep_async)
+        self.next_report = monotonic() + 60
+
+        if runtime == 'asyncio':
+            asyncio.run(self.run_async())
+        else:
+            self.run()
+
+    # new sensors get the next free id, moisture sensors also the next plant id
+    def add_sensor(self, measurement):
+        plant_id = self.counts[measurement] + 1 if measurement == "moisture" else 0
+        state = 50 if measurement == "moisture" else 0
+        self.registry.add(self.next_id, measurement, plant_id=plant_id, state=state)
+        if self.simulation is None:
+            self.sensors.append(self.create_sensor(self.next_id))
+        self.counts[measurement] += 1
+        self.next_id += 1
+
+    # removes the most recently added sensor of the measurement (the last plant for moisture)
+    def remove_sensor(self, measurement):
+        if measurement == "moisture":
+            id = int(self.registry.ids[self.registry.plant_position(self.counts[measurement])])
+        else:
+            id = int(self.registry.ids[self.registry.positions(measurement)].max())
+        sensor = self.registry.get(id)
+        topic = f"moisture/{id}/{sensor['plant_id']}" if measurement == "moisture" else f"{measurement}/{id}"
+        self.publisher.forget(topic)
+        position = self.registry.remove(id)
+        if self.simulation is None:
+            # mirror the registry, which moves its last sensor into the freed position
+            self.sensors[position] = self.sensors[-1]
+            self.sensors.pop()
+        self.counts[measurement] -= 1
+
+    def apply_config(self, config):
+        for measurement in MEASUREMENTS:
+            target = config['data']['sensors'].get(measurement, 0)
+            while self.counts[measurement] < target:
+                self.add_sensor(measurement)
+            while self.counts[measurement] > target:
+                self.remove_sensor(measurement)
+        for measurement, interval in config['data']['intervals'].items():
+            try:
+                self.scheduler.set_interval(measurement, interval)
+            except ValueError as e:
+                print(f"Interval not applied: {e}")
+        if self.publisher.report_filter is not None:
+            self.publisher.report_filter.configure(config['data'].get('reporting', {}))
+        self.config_version = config['version']
+        print(f"Config version {self.config_version} applied: {self.counts}")
+        if self.provisioner is not None:
+            Thread(target=self.provisioner, args=(config,), daemon=True).start()
+
+    def create_sensor(self, id):
+        sensor = self.registry.get(id)
+        if sensor['type'] == "temperature":
+            return self.TemperatureSensor(id=id, type='temperature', outer=self)
+        elif sensor['type'] == "humidity":
+            return self.AirHumiditySensor(id=id, type='humidity', outer=self)
+        elif sensor['type'] == "moisture":
+            return self.SoilMoistureSensor(id=id, type='moisture', outer=self, plant_id=sensor['plant_id'])
+        elif sensor['type'] == "light":
+            return self.LightSensor(id=id, type='light', outer=self)
 
     def initialize_mqtt(self):
         self.client.on_connect = self.on_connect
@@ -59,15 +167,29 @@ class Greenhouse:
         self.client.loop_forever()
 
     def on_connect(self, client, userdata, flags, rc):
-        self.client.subscribe('activate/#')
+        self.client.subscribe([('activate/#', 0), ('config/snapshot', 1)])
         print(f"Greenhouse connected and listening")
 
     # activate/<data-type>/<action> e.g. temperature/increase for non specific measurement
     # activate/<data-type>/<action>/<plant> e.g. moisture/increase/2
+    # with the 'model' engine the model actuators deliver the step over time instead of moving the value at once
     def on_message(self, client, userdata, msg):
         topic_split = str(msg.topic).split('/')
 
-        if topic_split[1] == 'temperature':
+        if topic_split[0] == 'config':
+            config = json.loads(msg.payload)
+            if config['version'] != self.config_version:
+                self.pending_config = config
+        elif self.model is not None and topic_split[1] in ('temperature', 'humidity', 'moisture'):
+            plant_id = int(topic_split[3]) if topic_split[1] == 'moisture' else 0
+            try:
+                if plant_id:
+                    self.registry.plant_position(plant_id)
+            except KeyError:
+                return
+            print(f"Message received {msg.topic} - {msg.payload.decode('utf-8')}")
+            self.model.actuate(topic_split[1], topic_split[2], plant_id)
+        elif topic_split[1] == 'temperature':
             print(f"Message received {msg.topic} - {msg.payload.decode('utf-8')}")
             if topic_split[2] == 'increase':
                 self.temperature += 2
@@ -80,31 +202,59 @@ class Greenhouse:
             elif topic_split[2] == 'decrease':
                 self.humidity -= 10
         elif topic_split[1] == 'moisture':
-            for sensor in self.sensors:
-                if isinstance(sensor, self.SoilMoistureSensor) and sensor.plant_id == int(topic_split[3]):
-                    print(f"Message received {msg.topic} - {msg.payload.decode('utf-8')}")
-                    if topic_split[2] == 'increase':
-                        sensor.moisture += 10
-                    elif topic_split[2] == 'decrease':
-                        sensor.moisture -= 10
+            # plant id -> registry position, the state is shared by both engines
+            try:
+                position = self.registry.plant_position(int(topic_split[3]))
+            except KeyError:
+                return
+            print(f"Message received {msg.topic} - {msg.payload.decode('utf-8')}")
+            if topic_split[2] == 'increase':
+                self.registry.state[position] += 10
+            elif topic_split[2] == 'decrease':
+                self.registry.state[position] -= 10
         elif topic_split[1] == 'light':
-            for sensor in self.sensors:
-                if isinstance(sensor, self.LightSensor):
-                    if topic_split[2] == 'on':
-                        sensor.light_on = True
-                    else:
-                        sensor.light_on = False
+            self.light_on = topic_split[2] == 'on'
+
+    def read(self, measurements):
+        if self.pending_config is not None:
+            config, self.pending_config = self.pending_config, None
+            self.apply_config(config)
+
+        if self.simulation:
+            return self.simulation.step(measurements)
+        # sensor objects are created in registry order, so registry positions index self.sensors
+        return [self.sensors[p].get_publish_data() for m in measurements for p in self.registry.positions(m)]
+
+    # every minute the tick counters of the scheduler (ticks, overruns, jitter in simulated seconds) are
+    # published retained on sensors/scheduler
+    def report(self):
+        if monotonic() < self.next_report:
+            return
+        self.next_report = monotonic() + 60
+        stats = self.scheduler.stats()
+        self.client.publish('sensors/scheduler', json.dumps(stats, separators=(',', ':')), retain=True)
+        print("Ticks: " + ", ".join(f"{measurement} {s['ticks']} ({s['overruns']} overruns, "
+                                    f"max jitter {s['max_jitter'] * 1000:.1f} ms)" for measurement, s in stats.items()))
 
     def run(self):
         while True:
-            for sensor in self.sensors:
-                data = sensor.get_publish_data()
-                topic = data[0]
-                payload = data[1]
-                self.client.publish(topic, payload)
-            sleep(5)
+            due = self.scheduler.wait()
+            self.publisher.publish(self.read(due))
+            self.report()
+
+    async def run_async(self):
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        mqtt_asyncio.connect(asyncio.get_running_loop(), self.client)
 
+        while True:
+            due = await self.scheduler.wait_async()
+            self.publisher.publish(self.read(due))
+            self.report()
+
+    # sensor objects only keep identity fields in __slots__, their state lives in the registry
     class Sensor:
+        __slots__ = ('id', 'type', 'outer')
 
         def __init__(self, id, type, outer):
             self.id = id
@@ -116,11 +266,21 @@ class Greenhouse:
             pass
 
     class SoilMoistureSensor(Sensor):
+        __slots__ = ('plant_id',)
 
         def __init__(self, id, plant_id, type, outer):
             super().__init__(id, type, outer)
             self.plant_id = plant_id
-            self.moisture = 50
+
+        @property
+        def moisture(self):
+            registry = self.outer.registry
+            return int(registry.state[registry.position(self.id)])
+
+        @moisture.setter
+        def moisture(self, value):
+            registry = self.outer.registry
+            registry.state[registry.position(self.id)] = value
 
         def get_publish_data(self):
             # Randomly changes the actual temperature of the greenhouse with probability 0.1
@@ -131,6 +291,7 @@ class Greenhouse:
             return f"moisture/{self.id}/{self.plant_id}", self.moisture
 
     class AirHumiditySensor(Sensor):
+        __slots__ = ()
 
         def get_publish_data(self):
             # Randomly changes the actual temperature of the greenhouse with probability 0.1
@@ -141,6 +302,7 @@ class Greenhouse:
             return f"humidity/{self.id}", self.outer.humidity + random.randint(-1, 1)
 
     class TemperatureSensor(Sensor):
+        __slots__ = ()
 
         def get_publish_data(self):
             # Randomly changes the actual temperature of the greenhouse with probability 0.1
@@ -151,9 +313,10 @@ class Greenhouse:
             return f"temperature/{self.id}", self.outer.temperature + random.randint(-1, 1)
 
     class LightSensor(Sensor):
-        light_on = False
+        __slots__ = ()
+
         def get_publish_data(self):
-            if self.light_on:
+            if self.outer.light_on:
                 self.outer.light = 255
             else:
                 self.outer.light = self.getLightValue()
@@ -161,17 +324,7 @@ class Greenhouse:
             return f"light/{self.id}", self.outer.light
 
         def getLightValue(self):
-            hour = datetime.datetime.now().hour
-
-            minute = datetime.datetime.now().minute
-
-            value = hour * 60 + minute  # 0 - 1440
-
-            mapped_value = interp(value, [0, 1440], [0, 360])
-
-            sin = math.sin(math.radians(mapped_value) + math.pi * (3 / 2))
-
-            light_value = interp(sin, [-1, 1], [0, 255])
+            light_value = daylight(self.outer.clock.now())
 
             rand = random.randint(0, 4)  # 0.2 probability of oscillating around function
 
@@ -186,742 +339,22 @@ class Greenhouse:
             return value
 
 
+# whole config (sensors, intervals and thresholds) and its version in a single request
 @retry
-def init_flows():
-    moist_sens = requests.get(f"http://config:5008/config/sensors/moisture").json()['data']
-
-    flow_id = ""
-    check_flow = requests.get(f"http://nodered:1880/flows").json()
-
-    for flow in check_flow:
-        # se il flow esiste, mi prendo l'id per usarlo dopo
-        if flow['type'] == "tab":
-            if flow['label'] == "Moisture":
-                flow_id = flow["id"]
-                response = requests.delete(f"http://nodered:1880/flow/{flow['id']}")
-                break
-
-    nodes = []
-    configs = []
-    x = 100
-    y = 60
-    for i in range(1, moist_sens + 1):
-        ui_group = {
-            "id": f"uigroup{i}",
-            "type": "ui_group",
-            "name": f"Moisture of Plant {i}",
-            "tab": "b95bdcd246960f21",
-            "order": 3,
-            "disp": True,
-            "width": "18",
-            "collapse": False,
-            "className": ""
-        }
-        configs.append(ui_group)
-
-        wave = {
-            "id": f"wave{i}",
-            "type": "ui_gauge",
-            "z": flow_id,
-            "name": "",
-            "group": f"uigroup{i}",
-            "order": 1,
-            "width": "6",
-            "height": "6",
-            "gtype": "wave",
-            "title": "",
-            "label": "%",
-            "format": "{{value}}",
-            "min": 0,
-            "max": "100",
-            "colors": [
-                "#b30000",
-                "#00b500",
-                "#b30000"
-            ],
-            "seg1": "50",
-            "seg2": "80",
-            "diff": False,
-            "className": "",
-            "x": 590,
-            "y": y,
-            "wires": []
-        }
-        nodes.append(wave)
-        plant = {
-            "id": f"plant{i}",
-            "type": "ui_gauge",
-            "z": flow_id,
-            "name": "",
-            "group": "df0de8f973aaf073",
-            "order": 2,
-            "width": 5,
-            "height": 5,
-            "gtype": "wave",
-            "title": f"Plant {i}",
-            "label": "%",
-            "format": "{{value}}",
-            "min": 0,
-            "max": "100",
-            "colors": [
-                "#b30000",
-                "#00b500",
-                "#b30000"
-            ],
-            "seg1": "50",
-            "seg2": "80",
-            "diff": False,
-            "className": "",
-            "x": 600,
-            "y": y + 40,
-            "wires": []
-        }
-        nodes.append(plant)
-        template = {
-            "id": f"template{i}",
-            "type": "ui_template",
-            "z": flow_id,
-            "group": f"uigroup{i}",
-            "name": f"template{i}",
-            "order": 2,
-            "width": "12",
-            "height": "8",
-            "format": f"<div style=\"border-radius: 10px; width: 100%; height: 100%; overflow: hidden;\">\n    <iframe src=\"http://localhost:3000/d-solo/47Y9EaJVz/new-dashboard?orgId=1&refresh=5s&theme=dark&panelId={i + 3}\"\n    width=\"100%\" height=\"100%\" frameborder=\"0\"></iframe>\n</div>",
-            "storeOutMessages": True,
-            "fwdInMessages": True,
-            "resendOnRefresh": True,
-            "templateScope": "local",
-            "className": "",
-            "x": 600,
-            "y": y - 40,
-            "wires": [
-                []
-            ]
-        }
-        nodes.append(template)
-
-        function = {
-            "id": f"function{i}",
-            "type": "function",
-            "z": flow_id,
-            "name": f"function{i}",
-            "func": "var payload = msg.payload\nvar sum = 0\nvar counter = 0\nfor (let index = 0; index < payload.length; index++) {\n    const element = payload[index]['_value'];\n    sum = sum + element;\n    counter = counter + 1\n}\nmsg.payload = (sum/counter) | 0\nmsg.debug = { '1': msg.payload }\nreturn msg;",
-            "outputs": 1,
-            "noerr": 0,
-            "initialize": "",
-            "finalize": "",
-            "libs": [],
-            "x": 410,
-            "y": y,
-            "wires": [
-                [
-                    f"plant{i}",
-                    f"wave{i}"
-                ]
-            ]
-        }
-        nodes.append(function)
-
-        query = {
-            "id": f"query{i}",
-            "type": "influxdb in",
-            "z": "cf0f97c5422f9808",
-            "influxdb": "f31dede1f911c00f",
-            "name": f"query{i}",
-            "query": f"from(bucket: \"iot\")\n  |> range(start: -1m)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"moisture\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> filter(fn: (r) => r[\"plant_id\"] == \"{i}\")\n  |> sort(columns: [\"_time\"], desc: true)",
-            "rawOutput": False,
-            "precision": "",
-            "retentionPolicy": "",
-            "org": "univaq",
-            "x": 240,
-            "y": y,
-            "wires": [
-                [
-                    f"function{i}"
-                ]
-            ]
-        }
-        nodes.append(query)
-
-        button_plus = {
-            "id": f"button_plus{i}",
-            "type": "ui_button",
-            "z": "cf0f97c5422f9808",
-            "name": "",
-            "group": f"uigroup{i}",
-            "order": 3,
-            "width": "3",
-            "height": "2",
-            "passthru": False,
-            "label": "+10%",
-            "tooltip": "",
-            "color": "",
-            "bgcolor": "#50bf6e",
-            "className": "",
-            "icon": "fa-arrow-up",
-            "payload": "",
-            "payloadType": "str",
-            "topic": f"waterpump/increase/{i}",
-            "topicType": "str",
-            "x": 170,
-            "y": y + 800,
-            "wires": [
-                [
-                    "mqtt_out"
-                ]
-            ]
-        }
-        button_minus = {
-            "id": f"button_minus{i}",
-            "type": "ui_button",
-            "z": "cf0f97c5422f9808",
-            "name": "",
-            "group": f"uigroup{i}",
-            "order": 4,
-            "width": "3",
-            "height": "2",
-            "passthru": False,
-            "label": "-10%",
-            "tooltip": "",
-            "color": "",
-            "bgcolor": "#bf5050",
-            "className": "",
-            "icon": "fa-arrow-down",
-            "payload": "",
-            "payloadType": "str",
-            "topic": f"waterpump/decrease/{i}",
-            "topicType": "str",
-            "x": 170,
-            "y": y + 850,
-            "wires": [
-                [
-                    "mqtt_out"
-                ]
-            ]
-        }
-        nodes.append(button_plus)
-        nodes.append(button_minus)
-        y += 150
-
-    mqtt_out = {
-        "id": "mqtt_out",
-        "type": "mqtt out",
-        "z": "cf0f97c5422f9808",
-        "name": "",
-        "topic": "",
-        "qos": "",
-        "retain": "",
-        "respTopic": "",
-        "contentType": "",
-        "userProps": "",
-        "correl": "",
-        "expiry": "",
-        "broker": "263cb68dcd37c7d7",
-        "x": 610,
-        "y": (y + 1000) / 2,
-        "wires": []
-    }
-
-    nodes.append(mqtt_out)
-
-    inject = {
-        "id": "inject",
-        "type": "inject",
-        "z": "cf0f97c5422f9808",
-        "name": "",
-        "props": [],
-        "repeat": "1",
-        "crontab": "",
-        "once": False,
-        "onceDelay": 0.1,
-        "topic": "",
-        "x": 90,
-        "y": y / 2,
-        "wires": [
-            [f"query{i}" for i in range(1, moist_sens + 1)]
-        ]
-    }
-
-    nodes.append(inject)
-    print(nodes)
-
-    flow = {
-        "type": "tab",
-        "label": "Moisture",
-        "nodes": nodes,
-        "configs": configs,
-        "disabled": False,
-        "info": "",
-        "env": []
-    }
-
-    add_flow = requests.post(f"http://nodered:1880/flow", json=flow)
-    print(add_flow.text)
+def get_config():
+    return requests.get("http://config:5008/config/snapshot").json()
+
 
-@retry
-def init_grafana():
-    key = "eyJrIjoiblVOcUZvckxIRHE3enFQUng2M3dRQXpOR2ZOQnNoT24iLCJuIjoiaW90IiwiaWQiOjF9"
-
-    panels = [
-        {
-            "datasource": {
-                "type": "influxdb",
-                "uid": "OI-rhbJVz"
-            },
-            "description": "",
-            "fieldConfig": {
-                "defaults": {
-                    "color": {
-                        "mode": "palette-classic"
-                    },
-                    "custom": {
-                        "axisCenteredZero": False,
-                        "axisColorMode": "text",
-                        "axisLabel": "",
-                        "axisPlacement": "auto",
-                        "barAlignment": 0,
-                        "drawStyle": "line",
-                        "fillOpacity": 0,
-                        "gradientMode": "none",
-                        "hideFrom": {
-                            "legend": False,
-                            "tooltip": False,
-                            "viz": False
-                        },
-                        "lineInterpolation": "smooth",
-                        "lineWidth": 2,
-                        "pointSize": 5,
-                        "scaleDistribution": {
-                            "type": "linear"
-                        },
-                        "showPoints": "never",
-                        "spanNulls": False,
-                        "stacking": {
-                            "group": "A",
-                            "mode": "none"
-                        },
-                        "thresholdsStyle": {
-                            "mode": "off"
-                        }
-                    },
-                    "decimals": 0,
-                    "mappings": [],
-                    "max": 255,
-                    "min": 0,
-                    "thresholds": {
-                        "mode": "absolute",
-                        "steps": [
-                            {
-                                "color": "green",
-                                "value": None
-                            },
-                            {
-                                "color": "red",
-                                "value": 80
-                            }
-                        ]
-                    }
-                },
-                "overrides": []
-            },
-            "gridPos": {
-                "h": 8,
-                "w": 12,
-                "x": 0,
-                "y": 0
-            },
-            "id": 1,
-            "options": {
-                "legend": {
-                    "calcs": [],
-                    "displayMode": "list",
-                    "placement": "bottom",
-                    "showLegend": False
-                },
-                "tooltip": {
-                    "mode": "single",
-                    "sort": "none"
-                }
-            },
-            "targets": [
-                {
-                    "datasource": {
-                        "type": "influxdb",
-                        "uid": "OI-rhbJVz"
-                    },
-                    "query": "from(bucket: \"iot\")\n  |> range(start: -1h)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"light\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> sort(columns: [\"_time\"], desc: true)",
-                    "refId": "A"
-                }
-            ],
-            "type": "timeseries"
-        },
-        {
-            "datasource": {
-                "type": "influxdb",
-                "uid": "OI-rhbJVz"
-            },
-            "description": "",
-            "fieldConfig": {
-                "defaults": {
-                    "color": {
-                        "mode": "palette-classic"
-                    },
-                    "custom": {
-                        "axisCenteredZero": False,
-                        "axisColorMode": "text",
-                        "axisLabel": "",
-                        "axisPlacement": "auto",
-                        "barAlignment": 0,
-                        "drawStyle": "line",
-                        "fillOpacity": 0,
-                        "gradientMode": "none",
-                        "hideFrom": {
-                            "legend": False,
-                            "tooltip": False,
-                            "viz": False
-                        },
-                        "lineInterpolation": "smooth",
-                        "lineStyle": {
-                            "fill": "solid"
-                        },
-                        "lineWidth": 2,
-                        "pointSize": 1,
-                        "scaleDistribution": {
-                            "type": "linear"
-                        },
-                        "showPoints": "auto",
-                        "spanNulls": False,
-                        "stacking": {
-                            "group": "A",
-                            "mode": "none"
-                        },
-                        "thresholdsStyle": {
-                            "mode": "off"
-                        }
-                    },
-                    "mappings": [],
-                    "max": 50,
-                    "min": 0,
-                    "thresholds": {
-                        "mode": "absolute",
-                        "steps": [
-                            {
-                                "color": "green",
-                                "value": None
-                            }
-                        ]
-                    },
-                    "unit": "celsius"
-                },
-                "overrides": [
-                    {
-                        "matcher": {
-                            "id": "byName",
-                            "options": "value 10"
-                        },
-                        "properties": [
-                            {
-                                "id": "color",
-                                "value": {
-                                    "fixedColor": "green",
-                                    "mode": "fixed"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            },
-            "gridPos": {
-                "h": 9,
-                "w": 12,
-                "x": 12,
-                "y": 8
-            },
-            "id": 2,
-            "options": {
-                "legend": {
-                    "calcs": [],
-                    "displayMode": "list",
-                    "placement": "bottom",
-                    "showLegend": False
-                },
-                "tooltip": {
-                    "mode": "single",
-                    "sort": "none"
-                }
-            },
-            "targets": [
-                {
-                    "datasource": {
-                        "type": "influxdb",
-                        "uid": "OI-rhbJVz"
-                    },
-                    "query": "from(bucket: \"iot\")\n  |> range(start: -5m)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"temperature\")\n  |> yield(name: \"mean\")",
-                    "refId": "A"
-                }
-            ],
-            "type": "timeseries"
-        },
-        {
-            "datasource": {
-                "type": "influxdb",
-                "uid": "OI-rhbJVz"
-            },
-            "fieldConfig": {
-                "defaults": {
-                    "color": {
-                        "mode": "palette-classic"
-                    },
-                    "custom": {
-                        "axisCenteredZero": False,
-                        "axisColorMode": "text",
-                        "axisLabel": "",
-                        "axisPlacement": "auto",
-                        "barAlignment": 0,
-                        "drawStyle": "line",
-                        "fillOpacity": 0,
-                        "gradientMode": "none",
-                        "hideFrom": {
-                            "legend": False,
-                            "tooltip": False,
-                            "viz": False
-                        },
-                        "lineInterpolation": "smooth",
-                        "lineStyle": {
-                            "fill": "solid"
-                        },
-                        "lineWidth": 2,
-                        "pointSize": 1,
-                        "scaleDistribution": {
-                            "type": "linear"
-                        },
-                        "showPoints": "auto",
-                        "spanNulls": False,
-                        "stacking": {
-                            "group": "A",
-                            "mode": "none"
-                        },
-                        "thresholdsStyle": {
-                            "mode": "off"
-                        }
-                    },
-                    "mappings": [],
-                    "max": 100,
-                    "min": 0,
-                    "thresholds": {
-                        "mode": "absolute",
-                        "steps": [
-                            {
-                                "color": "green",
-                                "value": None
-                            }
-                        ]
-                    },
-                    "unit": "humidity"
-                },
-                "overrides": [
-                    {
-                        "matcher": {
-                            "id": "byName",
-                            "options": "value 10"
-                        },
-                        "properties": [
-                            {
-                                "id": "color",
-                                "value": {
-                                    "fixedColor": "green",
-                                    "mode": "fixed"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            },
-            "gridPos": {
-                "h": 9,
-                "w": 12,
-                "x": 0,
-                "y": 16
-            },
-            "id": 3,
-            "options": {
-                "legend": {
-                    "calcs": [],
-                    "displayMode": "list",
-                    "placement": "bottom",
-                    "showLegend": False
-                },
-                "tooltip": {
-                    "mode": "single",
-                    "sort": "none"
-                }
-            },
-            "targets": [
-                {
-                    "datasource": {
-                        "type": "influxdb",
-                        "uid": "OI-rhbJVz"
-                    },
-                    "query": "from(bucket: \"iot\")\n  |> range(start: -5m)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"humidity\")\n  |> yield(name: \"mean\")",
-                    "refId": "A"
-                }
-            ],
-            "type": "timeseries"
-        }
-    ]
-
-    n = requests.get(f"http://config:5008/config/sensors/moisture").json()['data']
-    for i in range(1, n + 1):
-        moisture_panel = {
-            "datasource": {
-                "type": "influxdb",
-                "uid": "OI-rhbJVz"
-            },
-            "description": "",
-            "fieldConfig": {
-                "defaults": {
-                    "color": {
-                        "fixedColor": "blue",
-                        "mode": "fixed"
-                    },
-                    "custom": {
-                        "axisCenteredZero": False,
-                        "axisColorMode": "text",
-                        "axisLabel": "",
-                        "axisPlacement": "auto",
-                        "barAlignment": 0,
-                        "drawStyle": "line",
-                        "fillOpacity": 0,
-                        "gradientMode": "none",
-                        "hideFrom": {
-                            "legend": False,
-                            "tooltip": False,
-                            "viz": False
-                        },
-                        "lineInterpolation": "smooth",
-                        "lineWidth": 2,
-                        "pointSize": 5,
-                        "scaleDistribution": {
-                            "type": "linear"
-                        },
-                        "showPoints": "never",
-                        "spanNulls": False,
-                        "stacking": {
-                            "group": "A",
-                            "mode": "none"
-                        },
-                        "thresholdsStyle": {
-                            "mode": "off"
-                        }
-                    },
-                    "mappings": [],
-                    "max": 100,
-                    "min": 0,
-                    "thresholds": {
-                        "mode": "absolute",
-                        "steps": [
-                            {
-                                "color": "green",
-                                "value": None
-                            }
-                        ]
-                    },
-                    "unit": "%"
-                },
-                "overrides": []
-            },
-            "gridPos": {
-                "h": 8,
-                "w": 12,
-                "x": 12,
-                "y": 0
-            },
-            "id": i + 3,
-            "options": {
-                "legend": {
-                    "calcs": [],
-                    "displayMode": "list",
-                    "placement": "bottom",
-                    "showLegend": False
-                },
-                "tooltip": {
-                    "mode": "single",
-                    "sort": "none"
-                }
-            },
-            "pluginVersion": "9.3.6",
-            "targets": [
-                {
-                    "datasource": {
-                        "type": "influxdb",
-                        "uid": "OI-rhbJVz"
-                    },
-                    "query": f"from(bucket: \"iot\")\n  |> range(start: -1m)\n  |> filter(fn: (r) => r[\"_measurement\"] == \"moisture\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> filter(fn: (r) => r[\"plant_id\"] == \"{i}\")\n  |> yield(name: \"mean\")",
-                    "refId": "A"
-                }
-            ],
-            "title": f"Plant {i} Soil Moisture",
-            "type": "timeseries"
-        }
-
-        panels.append(moisture_panel)
-
-    dashboard = {"dashboard":
-        {
-            "annotations": {
-                "list": [
-                    {
-                        "builtIn": 1,
-                        "datasource": {
-                            "type": "grafana",
-                            "uid": "-- Grafana --"
-                        },
-                        "enable": True,
-                        "hide": True,
-                        "iconColor": "rgba(0, 211, 255, 1)",
-                        "name": "Annotations & Alerts",
-                        "target": {
-                            "limit": 100,
-                            "matchAny": False,
-                            "tags": [],
-                            "type": "dashboard"
-                        },
-                        "type": "dashboard"
-                    }
-                ]
-            },
-            "editable": True,
-            "fiscalYearStartMonth": 0,
-            "graphTooltip": 0,
-            "id": 1,
-            "links": [],
-            "liveNow": False,
-            "panels": panels,
-            "refresh": "5s",
-            "schemaVersion": 37,
-            "style": "dark",
-            "tags": [],
-            "templating": {
-                "list": []
-            },
-            "time": {
-                "from": "now-1m",
-                "to": "now"
-            },
-            "timepicker": {},
-            "timezone": "",
-            "title": "New dashboard",
-            "uid": "47Y9EaJVz",
-            "version": 11,
-            "weekStart": ""
-        },
-        "message": "Created panels dynamically",
-        "overwrite": True
-    }
-    headers = {"Authorization": f"Bearer {key}"}
-    post = requests.post("http://grafana:3000/api/dashboards/db", json=dashboard, headers=headers)
-    print(post.text)
 if __name__ == '__main__':
-    init_grafana()
-    init_flows()
-    gr = Greenhouse(temperature=23, humidity=50)
+    config = get_config()
+    # dashboards are provisioned in the background, the sensors start publishing right away
+    Thread(target=provision, args=(config,), daemon=True).start()
+    gr = Greenhouse(temperature=23, humidity=50, config=config, engine=os.environ.get('SIMULATION_ENGINE', 'objects'),
+                    publish_mode=os.environ.get('PUBLISH_MODE', 'topics'),
+                    runtime=os.environ.get('RUNTIME', 'threads'),
+                    report_mode=os.environ.get('REPORT_MODE', 'all'),
+                    payload_format=os.environ.get('PAYLOAD_FORMAT', 'text'),
+                    provisioner=provision,
+                    speed=float(os.environ.get('SIMULATION_SPEED', 1)),
+                    seed=int(os.environ['SIMULATION_SEED']) if os.environ.get('SIMULATION_SEED') else None,
+                    start=datetime.datetime.fromisoformat(os.environ['SIMULATION_START']) if os.environ.get('SIMULATION_START') else None)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import requests
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from rollups import BUCKETS, ROLLUPS, SHORTEN_RETENTION, rollup_task, shortens
+from templates import render_dashboard, render_flow
+
+NODERED_URL = "http://nodered:1880"
+GRAFANA_URL = "http://grafana:3000"
+GRAFANA_KEY = "eyJrIjoiblVOcUZvckxIRHE3enFQUng2M3dRQXpOR2ZOQnNoT24iLCJuIjoiaW90IiwiaWQiOjF9"
+DASHBOARD_UID = "47Y9EaJVz"
+INFLUX_URL = "http://influx:8086"
+INFLUX_ORG = "univaq"
+INFLUX_TOKEN = "iotinfluxdbtoken"
+# saved in the info of the tab and the description of the dashboard, tells what content was last deployed
+DEPLOYED = "Provisioned by the sensors service, content {}"
+
+# Grafana and Node-RED may still be starting: failed calls are retried with exponential backoff (0.5s doubling up
+# to 10s) and given up after 8 attempts, so a missing service cannot hold the greenhouse back forever.
+# Only connection errors, timeouts and server errors are retried, a 4xx will not change on the next attempt.
+def transient(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+backoff = retry(retry=retry_if_exception(transient),
+                wait=wait_exponential(multiplier=0.5, max=10),
+                stop=stop_after_attempt(8),
+                reraise=True)
+
+
+class RenderCache:
+    # Rendered json of the dashboard artifacts by name and config version, with the hash of its content.
+    # Config changes that do not touch the plants render the same content, which is then recognized by its
+    # hash as already deployed. The last size versions are kept.
+
+    def __init__(self, size=4):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, version, render):
+        key = (name, version)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        text = render()
+        entry = self.entries[key] = (text, hashlib.sha256(text.encode()).hexdigest()[:16])
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return entry
+
+
+cache = RenderCache()
+# a provisioning started by a config change waits for the previous one
+provision_lock = Lock()
+
+
+# Hash gated whole tab write: the tab is left alone when it was deployed with the same content hash, otherwise
+# it is replaced in place (PUT /flow/<id> restarts that tab only, the other flows keep running)
+@backoff
+def sync_flow(config):
+    session = requests.Session()
+    text, digest = cache.get('flow', config['version'], lambda: render_flow(config['data']['sensors']['moisture']))
+    response = session.get(f"{NODERED_URL}/flows")
+    response.raise_for_status()
+    tab = next((flow for flow in response.json() if flow['type'] == "tab" and flow.get('label') == "Moisture"), None)
+    if tab is not None and tab.get('info') == DEPLOYED.format(digest):
+        print("Moisture flow is up to date")
+        return
+
+    flow = {"type": "tab", "label": "Moisture", "disabled": False, "info": DEPLOYED.format(digest), "env": [],
+            **json.loads(text)}
+    if tab is None:
+        response = session.post(f"{NODERED_URL}/flow", json=flow)
+        response.raise_for_status()
+        print(f"Moisture flow created: {response.text}")
+        return
+
+    response = session.put(f"{NODERED_URL}/flow/{tab['id']}", json={**flow, "id": tab['id']})
+    response.raise_for_status()
+    print(f"Moisture flow updated: {len(flow['nodes'])} nodes")
+
+
+# Hash gated whole dashboard write: Grafana only saves whole dashboards, the dashboard is posted unless it was
+# saved with the same content hash
+@backoff
+def sync_dashboard(config):
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Bearer {GRAFANA_KEY}"})
+    text, digest = cache.get('dashboard', config['version'],
+                             lambda: render_dashboard(config['data']['sensors']['moisture']))
+
+    response = session.get(f"{GRAFANA_URL}/api/dashboards/uid/{DASHBOARD_UID}")
+    if response.status_code != 404:
+        response.raise_for_status()
+        if response.json()['dashboard'].get('description') == DEPLOYED.format(digest):
+            print("Dashboard is up to date")
+            return
+
+    dashboard = {**json.loads(text), "description": DEPLOYED.format(digest)}
+    response = session.post(f"{GRAFANA_URL}/api/dashboards/db", json={
+        "dashboard": dashboard,
+        "message": "Created panels dynamically",
+        "overwrite": True
+    })
+    response.raise_for_status()
+    print(response.text)
+
+
+# Retention tiers and rollup tasks of rollups.py: buckets are created or get their retention updated (only made
+# shorter with SHORTEN_RETENTION), tasks are created or get their flux updated and are reactivated, only what
+# differs is written. The rollups start from the
+# points written after their creation, older points are not backfilled.
+@backoff
+def sync_influx(config):
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Token {INFLUX_TOKEN}"})
+    response = session.get(f"{INFLUX_URL}/api/v2/orgs", params={"org": INFLUX_ORG})
+    response.raise_for_status()
+    org_id = response.json()['orgs'][0]['id']
+
+    response = session.get(f"{INFLUX_URL}/api/v2/buckets", params={"orgID": org_id, "limit": 100})
+    response.raise_for_status()
+    buckets = {bucket['name']: bucket for bucket in response.json()['buckets']}
+    for name, retention in BUCKETS:
+        # 0 seconds keeps the points forever
+        rules = [{"type": "expire", "everySeconds": retention}]
+        bucket = buckets.get(name)
+        if bucket is None:
+            response = session.post(f"{INFLUX_URL}/api/v2/buckets",
+                                    json={"orgID": org_id, "name": name, "retentionRules": rules})
+            response.raise_for_status()
+            print(f"Bucket {name} created")
+            continue
+        current = max([rule.get('everySeconds', 0) for rule in bucket.get('retentionRules', [])], default=0)
+        if current == retention:
+            continue
+        if shortens(retention, current) and not SHORTEN_RETENTION:
+            print(f"Bucket {name} keeps its retention of {current}s, set SHORTEN_RETENTION=true to delete the "
+                  f"points older than {retention}s")
+            continue
+        response = session.patch(f"{INFLUX_URL}/api/v2/buckets/{bucket['id']}", json={"retentionRules": rules})
+        response.raise_for_status()
+        print(f"Bucket {name} retention set to {retention}s")
+
+    response = session.get(f"{INFLUX_URL}/api/v2/tasks", params={"orgID": org_id, "limit": 100})
+    response.raise_for_status()
+    tasks = {task['name']: task for task in response.json()['tasks']}
+    for rollup in ROLLUPS:
+        name = rollup[0]
+        flux = rollup_task(*rollup, org=INFLUX_ORG)
+        task = tasks.get(name)
+        if task is None:
+            response = session.post(f"{INFLUX_URL}/api/v2/tasks", json={"orgID": org_id, "flux": flux})
+            response.raise_for_status()
+            print(f"Task {name} created")
+        elif task.get('flux') != flux or task.get('status') != 'active':
+            response = session.patch(f"{INFLUX_URL}/api/v2/tasks/{task['id']}", json={"flux": flux, "status": "active"})
+            response.raise_for_status()
+            print(f"Task {name} updated")
+    print("Influx retention tiers and rollups are up to date")
+
+
+# Influx, Grafana and Node-RED are independent, they are provisioned concurrently. A failure is reported without stopping
+# the sensors, the dashboards are provisioned again with the next config or on the next start.
+def provision(config):
+    tasks = {"Influx": sync_influx, "Dashboard": sync_dashboard, "Moisture flow": sync_flow}
+    with provision_lock:
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = {name: executor.submit(task, config) for name, task in tasks.items()}
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{name} provisioning failed: {e!r}")
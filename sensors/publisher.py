@@ -0,0 +1,182 @@
+import json
+from time import monotonic
+
+from codec import PAYLOAD_FORMATS, encode_batch, encode_reading, encode_text_batch, encode_text_reading, now_ms
+
+PUBLISH_MODES = ["topics", "batch", "both"]
+
+
+class Publisher:
+    # Publishes the readings of a tick.
+    # 'topics' sends one message per sensor (<measurement>/<id>[/<plant_id>]), 'batch' sends one message per
+    # measurement on batch/<measurement> with the readings of the tick in a compact json object,
+    # 'both' sends both for consumers that still read the per-sensor topics.
+    # With a report_filter only the readings it lets through are sent, followed by its summaries.
+    # payload_format is either 'text' (json) or 'binary' (fixed width payloads with the sensor id), see
+    # common/codec.py. Every message carries the timestamp of the tick and the next sequence number of its
+    # topic, so consumers can tell lost, duplicated and late messages apart (common/sequence.py).
+    # clock returns the timestamp in ms of a tick, the simulated time when the simulation is accelerated.
+
+    def __init__(self, client, mode='topics', report_filter=None, payload_format='text', clock=now_ms):
+        if mode not in PUBLISH_MODES:
+            raise ValueError(f"Unknown publish mode {mode}, expected one of {PUBLISH_MODES}")
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Unknown payload format {payload_format}, expected one of {PAYLOAD_FORMATS}")
+        self.client = client
+        self.mode = mode
+        self.report_filter = report_filter
+        self.payload_format = payload_format
+        self.clock = clock
+        # topic -> last sequence number published on it
+        self.sequences = {}
+
+    def next_seq(self, topic):
+        seq = self.sequences.get(topic, 0) + 1
+        self.sequences[topic] = seq
+        return seq
+
+    # removed sensors start again from 1 if they are added back
+    def forget(self, topic):
+        self.sequences.pop(topic, None)
+        if self.report_filter is not None:
+            self.report_filter.forget(topic)
+
+    def publish(self, readings):
+        # the readings of a tick share its timestamp, taken before filtering so it is the time they were read
+        timestamp = self.clock()
+        if self.report_filter is not None:
+            readings = self.report_filter.filter(readings)
+            for measurement, summary in self.report_filter.summaries().items():
+                self.client.publish(f"summary/{measurement}", json.dumps(summary, separators=(',', ':')))
+
+        if self.payload_format == 'binary':
+            self.publish_binary(readings, timestamp)
+            return
+
+        if self.mode in ('topics', 'both'):
+            for topic, value in readings:
+                self.client.publish(topic, encode_text_reading(value, self.next_seq(topic), timestamp))
+
+        if self.mode in ('batch', 'both'):
+            for measurement, batch in self.group(readings).items():
+                topic = f"batch/{measurement}"
+                self.client.publish(topic, encode_text_batch(batch, self.next_seq(topic), timestamp))
+
+    def publish_binary(self, readings, timestamp):
+        if self.mode in ('topics', 'both'):
+            for topic, value in readings:
+                self.client.publish(topic, encode_reading(int(topic.split('/', 2)[1]), self.next_seq(topic), value,
+                                                          timestamp))
+
+        if self.mode in ('batch', 'both'):
+            for measurement, records in self.records(readings).items():
+                topic = f"batch/{measurement}"
+                self.client.publish(topic, encode_batch(records, self.next_seq(topic), timestamp))
+
+    @staticmethod
+    def group(readings):
+        batches = {}
+        for topic, payload in readings:
+            measurement, key = topic.split('/', 1)
+            batches.setdefault(measurement, {})[key] = payload
+        return batches
+
+    # (sensor id, plant id, value) records of every measurement
+    @staticmethod
+    def records(readings):
+        records = {}
+        for topic, value in readings:
+            topic_split = topic.split('/')
+            plant_id = int(topic_split[2]) if len(topic_split) > 2 else 0
+            records.setdefault(topic_split[0], []).append((int(topic_split[1]), plant_id, value))
+        return records
+
+
+class ReportFilter:
+    # Report by exception: a reading is only published when it moved by at least the deadband of its
+    # measurement since the last published value of the sensor (any change with a deadband of 0), or when the
+    # sensor has not been published for heartbeat seconds, so consumers can tell a stable sensor from a dead one.
+    # Downsampling: every reading, published or not, is folded into per sensor min/mean/max over summary
+    # seconds, published as summary/<measurement> {"<id>[/<plant_id>]": [min, mean, max, count]}.
+    # reporting is the "reporting" section of the config.
+
+    def __init__(self, reporting, clock=monotonic):
+        self.clock = clock
+        # topic -> [last published value, time it was published, deadband]
+        self.last = {}
+        # topic -> [min, max, sum, count] since the last summary
+        self.stats = {}
+        self.summary = None
+        self.configure(reporting)
+        self.received = 0
+        self.reported = 0
+
+    def configure(self, reporting):
+        self.deadbands = reporting.get('deadbands', {})
+        self.heartbeat = reporting.get('heartbeat', 60)
+        summary = reporting.get('summary', 60)
+        if summary != self.summary:
+            # a new summary interval starts counting now instead of after the previous interval
+            self.summary = summary
+            self.next_summary = self.clock() + summary
+        # cached deadbands are refreshed on the next reading of every sensor
+        for last in self.last.values():
+            last[2] = None
+
+    def filter(self, readings, now=None):
+        now = self.clock() if now is None else now
+        reported = []
+        for topic, value in readings:
+            self.received += 1
+            stats = self.stats.get(topic)
+            if stats is None:
+                self.stats[topic] = [value, value, value, 1]
+            else:
+                if value < stats[0]:
+                    stats[0] = value
+                if value > stats[1]:
+                    stats[1] = value
+                stats[2] += value
+                stats[3] += 1
+
+            last = self.last.get(topic)
+            if last is None:
+                last = self.last[topic] = [value, now, self.deadbands.get(topic.partition('/')[0], 0)]
+            else:
+                if last[2] is None:
+                    last[2] = self.deadbands.get(topic.partition('/')[0], 0)
+                change = abs(value - last[0])
+                if (change == 0 or change < last[2]) and now - last[1] < self.heartbeat:
+                    continue
+                last[0] = value
+                last[1] = now
+            reported.append((topic, value))
+        self.reported += len(reported)
+        return reported
+
+    # summaries of the readings since the previous ones, once every summary seconds
+    def summaries(self, now=None):
+        now = self.clock() if now is None else now
+        if not self.summary or now < self.next_summary:
+            return {}
+        self.next_summary += self.summary
+        if self.next_summary <= now:
+            # after a stall the summaries go on every summary seconds from now, not on every tick until they catch up
+            self.next_summary = now + self.summary
+
+        summaries = {}
+        for topic, (minimum, maximum, total, count) in self.stats.items():
+            measurement, key = topic.split('/', 1)
+            summaries.setdefault(measurement, {})[key] = [minimum, round(total / count, 2), maximum, count]
+        self.stats = {}
+
+        print(f"Reported {self.reported} of {self.received} readings "
+              f"({self.reported / max(1, self.received) * 100:.0f}%) since the previous summary")
+        self.received = 0
+        self.reported = 0
+        return summaries
+
+    # removed sensors must not be summarized or remembered
+    def forget(self, topic):
+        self.last.pop(topic, None)
+        self.stats.pop(topic, None)
@@ -0,0 +1,144 @@
+import numpy as np
+
+from measurements import MEASUREMENTS
+
+
+class SensorRegistry:
+    # Struct-of-arrays storage for sensors: every field is a numpy array indexed by the sensor
+    # position, so a sensor costs a fixed number of bytes instead of a python object with a __dict__.
+    # The sensor type is stored as its position in MEASUREMENTS. Sensor ids are small consecutive
+    # integers, so the id -> position map is an array indexed by id as well (-1 for unknown ids).
+    # The same is done for plant ids, while the positions of each sensor type are cached.
+
+    FIELDS = {
+        "ids": np.uint32,
+        "types": np.uint8,
+        "plant_ids": np.uint32,
+        "state": np.float64,
+    }
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.capacity = capacity
+        for field, dtype in self.FIELDS.items():
+            setattr(self, f"_{field}", np.zeros(capacity, dtype=dtype))
+        self._index = np.full(capacity + 1, -1, dtype=np.int32)
+        self._plant_index = np.full(capacity + 1, -1, dtype=np.int32)
+        self._by_type = {}
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, id):
+        return 0 <= id < len(self._index) and self._index[id] >= 0
+
+    # the arrays are exposed trimmed to the number of registered sensors
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def types(self):
+        return self._types[:self.size]
+
+    @property
+    def plant_ids(self):
+        return self._plant_ids[:self.size]
+
+    @property
+    def state(self):
+        return self._state[:self.size]
+
+    def add(self, id, type, plant_id=0, state=0):
+        if id in self:
+            raise ValueError(f"Sensor {id} already registered")
+        if self.size == self.capacity:
+            self._grow()
+        self._index = self._fit(self._index, id)
+        self._plant_index = self._fit(self._plant_index, plant_id)
+
+        position = self.size
+        self._ids[position] = id
+        self._types[position] = MEASUREMENTS.index(type)
+        self._plant_ids[position] = plant_id
+        self._state[position] = state
+        self._index[id] = position
+        if plant_id:
+            self._plant_index[plant_id] = position
+        self._by_type.pop(type, None)
+        self.size += 1
+        return position
+
+    # the last sensor is moved into the freed position, returns the position of the removed sensor
+    def remove(self, id):
+        position = self.position(id)
+        last = self.size - 1
+        self._by_type.pop(MEASUREMENTS[self._types[position]], None)
+        self._index[id] = -1
+        if self._plant_ids[position]:
+            self._plant_index[self._plant_ids[position]] = -1
+
+        if position != last:
+            for field in self.FIELDS:
+                array = getattr(self, f"_{field}")
+                array[position] = array[last]
+            self._index[self._ids[position]] = position
+            if self._plant_ids[position]:
+                self._plant_index[self._plant_ids[position]] = position
+            self._by_type.pop(MEASUREMENTS[self._types[position]], None)
+
+        self.size -= 1
+        return position
+
+    def position(self, id):
+        if id not in self:
+            raise KeyError(id)
+        return int(self._index[id])
+
+    def plant_position(self, plant_id):
+        if not 0 < plant_id < len(self._plant_index) or self._plant_index[plant_id] < 0:
+            raise KeyError(plant_id)
+        return int(self._plant_index[plant_id])
+
+    def get(self, id):
+        position = self.position(id)
+        return {
+            "id": int(self._ids[position]),
+            "type": MEASUREMENTS[self._types[position]],
+            "plant_id": int(self._plant_ids[position]),
+            "state": float(self._state[position]),
+        }
+
+    def positions(self, type):
+        if type not in self._by_type:
+            self._by_type[type] = np.flatnonzero(self.types == MEASUREMENTS.index(type))
+        return self._by_type[type]
+
+    def build_index(self):
+        for type in MEASUREMENTS:
+            self.positions(type)
+
+    def nbytes(self):
+        # memory held by the arrays, including unused capacity and the id -> position map
+        indexes = self._index.nbytes + self._plant_index.nbytes + sum(p.nbytes for p in self._by_type.values())
+        return sum(getattr(self, f"_{field}").nbytes for field in self.FIELDS) + indexes
+
+    def bytes_per_sensor(self):
+        # fields, id and plant maps and the cached position in the type index
+        return sum(np.dtype(dtype).itemsize for dtype in self.FIELDS.values()) + 2 * 4 + 8
+
+    def _grow(self):
+        self.capacity *= 2
+        for field in self.FIELDS:
+            array = getattr(self, f"_{field}")
+            grown = np.zeros(self.capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, f"_{field}", grown)
+
+    @staticmethod
+    def _fit(index, key):
+        if key < len(index):
+            return index
+        grown = np.full(max(2 * len(index), key + 1), -1, dtype=np.int32)
+        grown[:len(index)] = index
+        return grown
@@ -0,0 +1,64 @@
+import os
+
+from measurements import MEASUREMENTS
+
+DAY = 24 * 60 * 60
+
+# Retention tiers: by default raw points are kept 30 days, their 1 minute means a year and the 1 hour means
+# forever (0), in days from RETENTION_RAW_DAYS, RETENTION_1M_DAYS and RETENTION_1H_DAYS. The rollups are written
+# by influx tasks every minute and every hour, per measurement and series, so moisture is averaged per plant
+# and the other measurements per sensor.
+BUCKETS = [
+    ("iot", int(os.environ.get('RETENTION_RAW_DAYS', 30)) * DAY),
+    ("iot_1m", int(os.environ.get('RETENTION_1M_DAYS', 365)) * DAY),
+    ("iot_1h", int(os.environ.get('RETENTION_1H_DAYS', 0)) * DAY),
+]
+# a shorter retention deletes the older points of an existing bucket, it is only applied when SHORTEN_RETENTION
+# is true, otherwise the bucket keeps its retention (the iot bucket of a new influx keeps its points forever)
+SHORTEN_RETENTION = os.environ.get('SHORTEN_RETENTION', 'false').lower() == 'true'
+
+
+# True when retention (seconds, 0 is forever) keeps the points for less time than current
+def shortens(retention, current):
+    return retention != 0 and (current == 0 or retention < current)
+
+# name, source bucket, destination bucket, period, offset (the 1h rollup waits for the last 1m rollup)
+ROLLUPS = [
+    ("rollup_1m", "iot", "iot_1m", "1m", "10s"),
+    ("rollup_1h", "iot_1m", "iot_1h", "1h", "2m"),
+]
+
+
+def rollup_task(name, source, destination, every, offset, org="univaq"):
+    measurements = " or ".join(f'r["_measurement"] == "{measurement}"' for measurement in MEASUREMENTS)
+    return (f'option task = {{name: "{name}", every: {every}, offset: {offset}}}\n\n'
+            f'from(bucket: "{source}")\n'
+            f'  |> range(start: -task.every)\n'
+            f'  |> filter(fn: (r) => {measurements})\n'
+            f'  |> filter(fn: (r) => r["_field"] == "value")\n'
+            f'  |> aggregateWindow(every: {every}, fn: mean, createEmpty: false)\n'
+            f'  |> to(bucket: "{destination}", org: "{org}")')
+
+
+# Flux prelude of the dashboard queries: `source` is the raw bucket for ranges up to 6 hours, the 1 minute
+# rollups up to 14 days and the 1 hour rollups beyond, and the next tier whenever the range starts before the
+# retention of a tier. The retention is read from the bucket itself, not from BUCKETS: without SHORTEN_RETENTION
+# an existing bucket keeps a longer one, and its older points are still there. The rollups keep the value field,
+# so the rest of a query is the same for every tier.
+SELECT_SOURCE = (
+    'span = int(v: v.timeRangeStop) - int(v: v.timeRangeStart)\n'
+    'age = int(v: now()) - int(v: v.timeRangeStart)\n'
+    '// retention of a bucket in ns, 0 keeps the points forever\n'
+    'retention = (bucket) => (buckets()\n'
+    '    |> filter(fn: (r) => r.name == bucket)\n'
+    '    |> findColumn(fn: (key) => true, column: "retentionPeriod"))[0]\n'
+    'expired = (bucket) => {\n'
+    '    period = retention(bucket: bucket)\n'
+    '    return period > 0 and age > period\n'
+    '}\n'
+    'source = if span > int(v: 14d) or expired(bucket: "iot_1m") then "iot_1h"\n'
+    '    else if span > int(v: 6h) or expired(bucket: "iot") then "iot_1m"\n'
+    '    else "iot"\n\n'
+    'from(bucket: source)\n'
+    '  |> range(start: v.timeRangeStart, stop: v.timeRangeStop)\n'
+)
@@ -0,0 +1,90 @@
+import asyncio
+from time import monotonic, sleep
+
+
+class TickScheduler:
+    # Deadline based tick scheduler with a separate period for every measurement.
+    # The next deadline is computed from the previous deadline, not from the end of the work, so the time
+    # spent publishing does not accumulate as drift. When a tick is late by one or more whole periods
+    # the missed ticks are counted as overruns and skipped instead of being published in a burst.
+
+    def __init__(self, intervals, clock=monotonic, sleep=sleep, sleep_async=asyncio.sleep):
+        for measurement, interval in intervals.items():
+            check_interval(measurement, interval)
+        self.intervals = dict(intervals)
+        self.clock = clock
+        self.sleep = sleep
+        self.sleep_async = sleep_async
+
+        now = self.clock()
+        self.deadlines = {measurement: now for measurement in self.intervals}
+        self.ticks = {measurement: 0 for measurement in self.intervals}
+        self.overruns = {measurement: 0 for measurement in self.intervals}
+        # lateness of the last tick and worst lateness seen, in seconds
+        self.jitter = {measurement: 0.0 for measurement in self.intervals}
+        self.max_jitter = {measurement: 0.0 for measurement in self.intervals}
+
+    def set_interval(self, measurement, interval):
+        check_interval(measurement, interval)
+        if measurement not in self.intervals:
+            self.deadlines[measurement] = self.clock()
+            self.ticks[measurement] = 0
+            self.overruns[measurement] = 0
+            self.jitter[measurement] = 0.0
+            self.max_jitter[measurement] = 0.0
+        self.intervals[measurement] = interval
+
+    # sleeps until the earliest deadline and returns the measurements that are due
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            self.sleep(delay)
+        return self.due()
+
+    async def wait_async(self):
+        delay = self.delay()
+        if delay > 0:
+            await self.sleep_async(delay)
+        return self.due()
+
+    def delay(self):
+        return min(self.deadlines.values()) - self.clock()
+
+    def due(self):
+        now = self.clock()
+        due = []
+        for measurement, deadline in self.deadlines.items():
+            if deadline > now:
+                continue
+
+            interval = self.intervals[measurement]
+            lateness = now - deadline
+            missed = int(lateness // interval)
+            if missed:
+                self.overruns[measurement] += missed
+                print(f"Tick for {measurement} overran by {lateness:.3f}s, skipping {missed} tick(s)")
+
+            self.ticks[measurement] += 1
+            self.jitter[measurement] = lateness - missed * interval
+            self.max_jitter[measurement] = max(self.max_jitter[measurement], self.jitter[measurement])
+            self.deadlines[measurement] = deadline + (missed + 1) * interval
+            due.append(measurement)
+
+        return due
+
+    def stats(self):
+        return {
+            measurement: {
+                "interval": self.intervals[measurement],
+                "ticks": self.ticks[measurement],
+                "overruns": self.overruns[measurement],
+                "jitter": self.jitter[measurement],
+                "max_jitter": self.max_jitter[measurement],
+            }
+            for measurement in self.intervals
+        }
+
+
+def check_interval(measurement, interval):
+    if not interval > 0:
+        raise ValueError(f"Interval of {measurement} must be positive, got {interval}")
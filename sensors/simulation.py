@@ -0,0 +1,107 @@
+import numpy as np
+
+from measurements import MEASUREMENTS
+from model import daylight
+
+
+class VectorizedSimulation:
+    # Batch counterpart of the Greenhouse.Sensor classes: the state of every sensor is kept in the
+    # numpy arrays of the SensorRegistry and each measurement is advanced with a single vectorized step per tick.
+    # Topics, ids and value distributions are the same as the per-object sensors.
+
+    def __init__(self, outer, registry, rng=None):
+        self.outer = outer
+        self.registry = registry
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def step(self, measurements=MEASUREMENTS):
+        readings = []
+        for measurement in measurements:
+            readings += getattr(self, f"_step_{measurement}")()
+        return readings
+
+    def _step_temperature(self):
+        ids = self.registry.ids[self.registry.positions("temperature")]
+        self.outer.temperature, values = self._shared_step(self.outer.temperature, len(ids))
+        return zip([f"temperature/{i}" for i in ids.tolist()], values.tolist())
+
+    def _step_humidity(self):
+        ids = self.registry.ids[self.registry.positions("humidity")]
+        self.outer.humidity, values = self._shared_step(self.outer.humidity, len(ids))
+        return zip([f"humidity/{i}" for i in ids.tolist()], values.tolist())
+
+    def _step_moisture(self):
+        registry = self.registry
+        positions = registry.positions("moisture")
+        registry.state[positions] += self._drift(len(positions))
+        topics = [f"moisture/{i}/{p}" for i, p in zip(registry.ids[positions].tolist(), registry.plant_ids[positions].tolist())]
+        return zip(topics, registry.state[positions].astype(np.int64).tolist())
+
+    def _step_light(self):
+        registry = self.registry
+        positions = registry.positions("light")
+        values = self._light_step(len(positions))
+        registry.state[positions] = values
+        if len(values):
+            self.outer.light = values[-1]
+        return zip([f"light/{i}" for i in registry.ids[positions].tolist()], values.tolist())
+
+    def _drift(self, n):
+        # each value changes by -1, 0 or +1 with probability 0.1
+        changed = self.rng.integers(1, 11, n) == 1
+        return np.where(changed, self.rng.integers(-1, 2, n), 0)
+
+    def _shared_step(self, value, n):
+        # temperature and humidity sensors share the greenhouse value and, like the sequential loop,
+        # each sensor sees the drift applied by the sensors read before it in the same tick
+        if n == 0:
+            return value, np.empty(0, dtype=np.int64)
+        states = value + np.cumsum(self._drift(n))
+        return int(states[-1]), states + self.rng.integers(-1, 2, n)
+
+    def _light_step(self, n):
+        if self.outer.light_on:
+            return np.full(n, 255)
+
+        base = daylight(self.outer.clock.now())
+        # 0.2 probability of oscillating around function, clipped to the 0 - 255 range
+        noisy = self.rng.integers(0, 5, n) == 0
+        values = base + np.where(noisy, self.rng.integers(-10, 11, n), 0)
+        return np.clip(values, 0, 255)
+
+
+class ModelSimulation(VectorizedSimulation):
+    # Same readings as VectorizedSimulation, but the greenhouse follows common/model.py instead of a random walk:
+    # every step integrates the model up to the simulated time of the clock, soil moisture of every plant is kept
+    # in the registry and the sensors read the model values with their own noise (0.3 degrees, 1% humidity,
+    # 0.5% moisture). Light sensors read the daylight of the simulated time.
+
+    def __init__(self, outer, registry, model, clock, rng=None):
+        super().__init__(outer, registry, rng)
+        self.model = model
+        self.clock = clock
+
+    def step(self, measurements=MEASUREMENTS):
+        registry = self.registry
+        positions = registry.positions("moisture")
+        registry.state[positions] = self.model.advance(self.clock(), registry.state[positions], registry.plant_ids[positions])
+        self.outer.temperature = round(self.model.temperature, 1)
+        self.outer.humidity = round(self.model.humidity, 1)
+        return super().step(measurements)
+
+    def _step_temperature(self):
+        ids = self.registry.ids[self.registry.positions("temperature")]
+        return zip([f"temperature/{i}" for i in ids.tolist()], self._read(self.model.temperature, 0.3, len(ids)))
+
+    def _step_humidity(self):
+        ids = self.registry.ids[self.registry.positions("humidity")]
+        return zip([f"humidity/{i}" for i in ids.tolist()], self._read(self.model.humidity, 1, len(ids)))
+
+    def _step_moisture(self):
+        registry = self.registry
+        positions = registry.positions("moisture")
+        topics = [f"moisture/{i}/{p}" for i, p in zip(registry.ids[positions].tolist(), registry.plant_ids[positions].tolist())]
+        return zip(topics, self._read(registry.state[positions], 0.5, len(positions)))
+
+    def _read(self, value, noise, n):
+        return np.round(np.clip(value + self.rng.normal(0, noise, n), 0, 100), 1).tolist()
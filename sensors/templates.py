@@ -0,0 +1,797 @@
+import json
+import re
+
+from rollups import SELECT_SOURCE
+
+# Per-plant dashboard artifacts rendered from shared templates. A template is written as the node or panel it
+# renders, "${name}" stands for a number and ${name} inside a string for its text. The template is serialized to
+# json once and every plant is a str.format of that text, so n plants cost n string formats instead of n
+# nested dict literals and json encodings.
+
+PLACEHOLDER = re.compile(r'"\$\{\{(\w+)\}\}"|\$\{\{(\w+)\}\}')
+
+
+class Template:
+
+    def __init__(self, template):
+        # braces of the json are escaped for str.format, then the placeholders become format fields
+        text = json.dumps(template, separators=(',', ':'), ensure_ascii=False).replace('{', '{{').replace('}', '}}')
+        self.text = PLACEHOLDER.sub(lambda match: '{' + (match.group(1) or match.group(2)) + '}', text)
+
+    def render(self, **values):
+        return self.text.format(**values)
+
+    def render_all(self, values):
+        return ",".join(self.text.format(**v) for v in values)
+
+
+# the nodes of a plant are laid out in rows of 150 px, the buttons in a second column further down,
+# the panels of the plants two per row below the static panels
+def plant_values(i):
+    y = 60 + 150 * (i - 1)
+    # key is the plant id as a json string, the name of its column in the moisture query
+    return {"i": i, "key": f'"{i}"', "panel": SOURCE_PANEL + i, "y": y, "y_plant": y + 40, "y_plus": y + 800,
+            "y_minus": y + 850, "panel_x": 12 * ((i - 1) % 2), "panel_y": PANELS_BOTTOM + 8 * ((i - 1) // 2)}
+
+
+# ui group and nodes of plant ${i}
+PLANT_GROUP = {
+    "id": "uigroup${i}",
+    "type": "ui_group",
+    "name": "Moisture of Plant ${i}",
+    "tab": "b95bdcd246960f21",
+    "order": 3,
+    "disp": True,
+    "width": "18",
+    "collapse": False,
+    "className": ""
+}
+
+PLANT_NODES = [
+    {
+        "id": "wave${i}",
+        "type": "ui_gauge",
+        "name": "",
+        "group": "uigroup${i}",
+        "order": 1,
+        "width": "6",
+        "height": "6",
+        "gtype": "wave",
+        "title": "",
+        "label": "%",
+        "format": "{{value}}",
+        "min": 0,
+        "max": "100",
+        "colors": [
+            "#b30000",
+            "#00b500",
+            "#b30000"
+        ],
+        "seg1": "50",
+        "seg2": "80",
+        "diff": False,
+        "className": "",
+        "x": 590,
+        "y": "${y}",
+        "wires": []
+    },
+    {
+        "id": "plant${i}",
+        "type": "ui_gauge",
+        "name": "",
+        "group": "df0de8f973aaf073",
+        "order": 2,
+        "width": 5,
+        "height": 5,
+        "gtype": "wave",
+        "title": "Plant ${i}",
+        "label": "%",
+        "format": "{{value}}",
+        "min": 0,
+        "max": "100",
+        "colors": [
+            "#b30000",
+            "#00b500",
+            "#b30000"
+        ],
+        "seg1": "50",
+        "seg2": "80",
+        "diff": False,
+        "className": "",
+        "x": 600,
+        "y": "${y_plant}",
+        "wires": []
+    },
+    {
+        "id": "function${i}",
+        "type": "function",
+        "name": "function${i}",
+        "func": "msg.payload = msg.payload.mean | 0\nreturn msg;",
+        "outputs": 1,
+        "noerr": 0,
+        "initialize": "",
+        "finalize": "",
+        "libs": [],
+        "x": 410,
+        "y": "${y}",
+        "wires": [
+            [
+                "plant${i}",
+                "wave${i}"
+            ]
+        ]
+    },
+    {
+        "id": "aggregate${i}",
+        "type": "mqtt in",
+        "name": "aggregate${i}",
+        "topic": "aggregate/moisture/plant/${i}",
+        "qos": "0",
+        "datatype": "json",
+        "broker": "263cb68dcd37c7d7",
+        "nl": False,
+        "rap": True,
+        "rh": 0,
+        "inputs": 0,
+        "x": 220,
+        "y": "${y}",
+        "wires": [
+            [
+                "function${i}"
+            ]
+        ]
+    },
+    {
+        "id": "button_plus${i}",
+        "type": "ui_button",
+        "name": "",
+        "group": "uigroup${i}",
+        "order": 3,
+        "width": "3",
+        "height": "2",
+        "passthru": False,
+        "label": "+10%",
+        "tooltip": "",
+        "color": "",
+        "bgcolor": "#50bf6e",
+        "className": "",
+        "icon": "fa-arrow-up",
+        "payload": "",
+        "payloadType": "str",
+        "topic": "waterpump/increase/${i}",
+        "topicType": "str",
+        "x": 170,
+        "y": "${y_plus}",
+        "wires": [
+            [
+                "mqtt_out"
+            ]
+        ]
+    },
+    {
+        "id": "button_minus${i}",
+        "type": "ui_button",
+        "name": "",
+        "group": "uigroup${i}",
+        "order": 4,
+        "width": "3",
+        "height": "2",
+        "passthru": False,
+        "label": "-10%",
+        "tooltip": "",
+        "color": "",
+        "bgcolor": "#bf5050",
+        "className": "",
+        "icon": "fa-arrow-down",
+        "payload": "",
+        "payloadType": "str",
+        "topic": "waterpump/decrease/${i}",
+        "topicType": "str",
+        "x": 170,
+        "y": "${y_minus}",
+        "wires": [
+            [
+                "mqtt_out"
+            ]
+        ]
+    }
+]
+
+# The moisture history of the plants is a single solo view of the moisture panel, which draws every plant from
+# one query, instead of a solo panel per plant: a solo panel does not render the source panel, so every plant
+# would run the query of every plant again.
+HISTORY_GROUP = {
+    "id": "uigroup_history",
+    "type": "ui_group",
+    "name": "Soil Moisture History",
+    "tab": "b95bdcd246960f21",
+    "order": 4,
+    "disp": True,
+    "width": "18",
+    "collapse": False,
+    "className": ""
+}
+
+HISTORY = {
+    "id": "history",
+    "type": "ui_template",
+    "group": "uigroup_history",
+    "name": "history",
+    "order": 1,
+    "width": "18",
+    "height": "8",
+    "format": "<div style=\"border-radius: 10px; width: 100%; height: 100%; overflow: hidden;\">\n    <iframe src=\"http://localhost:3000/d-solo/47Y9EaJVz/new-dashboard?orgId=1&refresh=5s&theme=dark&panelId=4\"\n    width=\"100%\" height=\"100%\" frameborder=\"0\"></iframe>\n</div>",
+    "storeOutMessages": True,
+    "fwdInMessages": True,
+    "resendOnRefresh": True,
+    "templateScope": "local",
+    "className": "",
+    "x": 600,
+    "y": 20,
+    "wires": [
+        []
+    ]
+}
+
+# shared by the buttons of every plant, halfway down the tab
+MQTT_OUT = {
+    "id": "mqtt_out",
+    "type": "mqtt out",
+    "name": "",
+    "topic": "",
+    "qos": "",
+    "retain": "",
+    "respTopic": "",
+    "contentType": "",
+    "userProps": "",
+    "correl": "",
+    "expiry": "",
+    "broker": "263cb68dcd37c7d7",
+    "x": 610,
+    "y": "${y}",
+    "wires": []
+}
+
+# light over the last hour, temperature and humidity over the last 5 minutes whatever the dashboard range
+STATIC_PANELS = [
+    {
+        "datasource": {
+            "type": "influxdb",
+            "uid": "OI-rhbJVz"
+        },
+        "description": "",
+        "fieldConfig": {
+            "defaults": {
+                "color": {
+                    "mode": "palette-classic"
+                },
+                "custom": {
+                    "axisCenteredZero": False,
+                    "axisColorMode": "text",
+                    "axisLabel": "",
+                    "axisPlacement": "auto",
+                    "barAlignment": 0,
+                    "drawStyle": "line",
+                    "fillOpacity": 0,
+                    "gradientMode": "none",
+                    "hideFrom": {
+                        "legend": False,
+                        "tooltip": False,
+                        "viz": False
+                    },
+                    "lineInterpolation": "smooth",
+                    "lineWidth": 2,
+                    "pointSize": 5,
+                    "scaleDistribution": {
+                        "type": "linear"
+                    },
+                    "showPoints": "never",
+                    "spanNulls": False,
+                    "stacking": {
+                        "group": "A",
+                        "mode": "none"
+                    },
+                    "thresholdsStyle": {
+                        "mode": "off"
+                    }
+                },
+                "decimals": 0,
+                "mappings": [],
+                "max": 255,
+                "min": 0,
+                "thresholds": {
+                    "mode": "absolute",
+                    "steps": [
+                        {
+                            "color": "green",
+                            "value": None
+                        },
+                        {
+                            "color": "red",
+                            "value": 80
+                        }
+                    ]
+                }
+            },
+            "overrides": []
+        },
+        "gridPos": {
+            "h": 8,
+            "w": 12,
+            "x": 0,
+            "y": 0
+        },
+        "id": 1,
+        "options": {
+            "legend": {
+                "calcs": [],
+                "displayMode": "list",
+                "placement": "bottom",
+                "showLegend": False
+            },
+            "tooltip": {
+                "mode": "single",
+                "sort": "none"
+            }
+        },
+        "targets": [
+            {
+                "datasource": {
+                    "type": "influxdb",
+                    "uid": "OI-rhbJVz"
+                },
+                "query": SELECT_SOURCE + "  |> filter(fn: (r) => r[\"_measurement\"] == \"light\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)",
+                "refId": "A"
+            }
+        ],
+        "type": "timeseries"
+    },
+    {
+        "datasource": {
+            "type": "influxdb",
+            "uid": "OI-rhbJVz"
+        },
+        "description": "",
+        "fieldConfig": {
+            "defaults": {
+                "color": {
+                    "mode": "palette-classic"
+                },
+                "custom": {
+                    "axisCenteredZero": False,
+                    "axisColorMode": "text",
+                    "axisLabel": "",
+                    "axisPlacement": "auto",
+                    "barAlignment": 0,
+                    "drawStyle": "line",
+                    "fillOpacity": 0,
+                    "gradientMode": "none",
+                    "hideFrom": {
+                        "legend": False,
+                        "tooltip": False,
+                        "viz": False
+                    },
+                    "lineInterpolation": "smooth",
+                    "lineStyle": {
+                        "fill": "solid"
+                    },
+                    "lineWidth": 2,
+                    "pointSize": 1,
+                    "scaleDistribution": {
+                        "type": "linear"
+                    },
+                    "showPoints": "auto",
+                    "spanNulls": False,
+                    "stacking": {
+                        "group": "A",
+                        "mode": "none"
+                    },
+                    "thresholdsStyle": {
+                        "mode": "off"
+                    }
+                },
+                "mappings": [],
+                "max": 50,
+                "min": 0,
+                "thresholds": {
+                    "mode": "absolute",
+                    "steps": [
+                        {
+                            "color": "green",
+                            "value": None
+                        }
+                    ]
+                },
+                "unit": "celsius"
+            },
+            "overrides": [
+                {
+                    "matcher": {
+                        "id": "byName",
+                        "options": "value 10"
+                    },
+                    "properties": [
+                        {
+                            "id": "color",
+                            "value": {
+                                "fixedColor": "green",
+                                "mode": "fixed"
+                            }
+                        }
+                    ]
+                }
+            ]
+        },
+        "gridPos": {
+            "h": 9,
+            "w": 12,
+            "x": 12,
+            "y": 8
+        },
+        "id": 2,
+        "options": {
+            "legend": {
+                "calcs": [],
+                "displayMode": "list",
+                "placement": "bottom",
+                "showLegend": False
+            },
+            "tooltip": {
+                "mode": "single",
+                "sort": "none"
+            }
+        },
+        "targets": [
+            {
+                "datasource": {
+                    "type": "influxdb",
+                    "uid": "OI-rhbJVz"
+                },
+                "query": SELECT_SOURCE + "  |> filter(fn: (r) => r[\"_measurement\"] == \"temperature\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)",
+                "refId": "A"
+            }
+        ],
+        "type": "timeseries"
+    },
+    {
+        "datasource": {
+            "type": "influxdb",
+            "uid": "OI-rhbJVz"
+        },
+        "fieldConfig": {
+            "defaults": {
+                "color": {
+                    "mode": "palette-classic"
+                },
+                "custom": {
+                    "axisCenteredZero": False,
+                    "axisColorMode": "text",
+                    "axisLabel": "",
+                    "axisPlacement": "auto",
+                    "barAlignment": 0,
+                    "drawStyle": "line",
+                    "fillOpacity": 0,
+                    "gradientMode": "none",
+                    "hideFrom": {
+                        "legend": False,
+                        "tooltip": False,
+                        "viz": False
+                    },
+                    "lineInterpolation": "smooth",
+                    "lineStyle": {
+                        "fill": "solid"
+                    },
+                    "lineWidth": 2,
+                    "pointSize": 1,
+                    "scaleDistribution": {
+                        "type": "linear"
+                    },
+                    "showPoints": "auto",
+                    "spanNulls": False,
+                    "stacking": {
+                        "group": "A",
+                        "mode": "none"
+                    },
+                    "thresholdsStyle": {
+                        "mode": "off"
+                    }
+                },
+                "mappings": [],
+                "max": 100,
+                "min": 0,
+                "thresholds": {
+                    "mode": "absolute",
+                    "steps": [
+                        {
+                            "color": "green",
+                            "value": None
+                        }
+                    ]
+                },
+                "unit": "humidity"
+            },
+            "overrides": [
+                {
+                    "matcher": {
+                        "id": "byName",
+                        "options": "value 10"
+                    },
+                    "properties": [
+                        {
+                            "id": "color",
+                            "value": {
+                                "fixedColor": "green",
+                                "mode": "fixed"
+                            }
+                        }
+                    ]
+                }
+            ]
+        },
+        "gridPos": {
+            "h": 9,
+            "w": 12,
+            "x": 0,
+            "y": 16
+        },
+        "id": 3,
+        "options": {
+            "legend": {
+                "calcs": [],
+                "displayMode": "list",
+                "placement": "bottom",
+                "showLegend": False
+            },
+            "tooltip": {
+                "mode": "single",
+                "sort": "none"
+            }
+        },
+        "targets": [
+            {
+                "datasource": {
+                    "type": "influxdb",
+                    "uid": "OI-rhbJVz"
+                },
+                "query": SELECT_SOURCE + "  |> filter(fn: (r) => r[\"_measurement\"] == \"humidity\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)",
+                "refId": "A"
+            }
+        ],
+        "type": "timeseries"
+    }
+]
+
+# The moisture of every plant comes from a single query grouped by plant: the moisture panel runs it and draws
+# every plant, the panels of the plants reuse its result through the "-- Dashboard --" datasource, so a refresh of
+# the dashboard view is one query whatever the number of plants (a solo view of a plant panel runs it again, the
+# Node-RED tab embeds the moisture panel, see HISTORY). The query pivots the plants into columns named by their
+# plant_id, every plant panel keeps the time and its own column.
+SOURCE_PANEL = 4
+# the plant panels start below the static panels
+PANELS_BOTTOM = max(panel["gridPos"]["y"] + panel["gridPos"]["h"] for panel in STATIC_PANELS)
+MOISTURE_QUERY = {
+    "datasource": {
+        "type": "influxdb",
+        "uid": "OI-rhbJVz"
+    },
+    "query": SELECT_SOURCE + "  |> filter(fn: (r) => r[\"_measurement\"] == \"moisture\")\n  |> filter(fn: (r) => r[\"_field\"] == \"value\")\n  |> group(columns: [\"plant_id\"])\n  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)\n  |> group()\n  |> pivot(rowKey: [\"_time\"], columnKey: [\"plant_id\"], valueColumn: \"_value\")",
+    "refId": "A"
+}
+
+PLANT_PANEL = {
+    "datasource": {
+        "type": "datasource",
+        "uid": "-- Dashboard --"
+    },
+    "description": "",
+    "fieldConfig": {
+        "defaults": {
+            "color": {
+                "fixedColor": "blue",
+                "mode": "fixed"
+            },
+            "custom": {
+                "axisCenteredZero": False,
+                "axisColorMode": "text",
+                "axisLabel": "",
+                "axisPlacement": "auto",
+                "barAlignment": 0,
+                "drawStyle": "line",
+                "fillOpacity": 0,
+                "gradientMode": "none",
+                "hideFrom": {
+                    "legend": False,
+                    "tooltip": False,
+                    "viz": False
+                },
+                "lineInterpolation": "smooth",
+                "lineWidth": 2,
+                "pointSize": 5,
+                "scaleDistribution": {
+                    "type": "linear"
+                },
+                "showPoints": "never",
+                "spanNulls": False,
+                "stacking": {
+                    "group": "A",
+                    "mode": "none"
+                },
+                "thresholdsStyle": {
+                    "mode": "off"
+                }
+            },
+            "mappings": [],
+            "max": 100,
+            "min": 0,
+            "thresholds": {
+                "mode": "absolute",
+                "steps": [
+                    {
+                        "color": "green",
+                        "value": None
+                    }
+                ]
+            },
+            "unit": "%"
+        },
+        "overrides": []
+    },
+    "gridPos": {
+        "h": 8,
+        "w": 12,
+        "x": "${panel_x}",
+        "y": "${panel_y}"
+    },
+    "id": "${panel}",
+    "options": {
+        "legend": {
+            "calcs": [],
+            "displayMode": "list",
+            "placement": "bottom",
+            "showLegend": False
+        },
+        "tooltip": {
+            "mode": "single",
+            "sort": "none"
+        }
+    },
+    "pluginVersion": "9.3.6",
+    "targets": [
+        {
+            "datasource": {
+                "type": "datasource",
+                "uid": "-- Dashboard --"
+            },
+            "panelId": SOURCE_PANEL,
+            "refId": "A"
+        }
+    ],
+    "transformations": [
+        {
+            "id": "filterFieldsByName",
+            "options": {
+                "include": {
+                    "names": [
+                        "_time",
+                        "${key}"
+                    ]
+                }
+            }
+        }
+    ],
+    "title": "Plant ${i} Soil Moisture",
+    "type": "timeseries"
+}
+
+# same panel with the query and a series of every plant, next to the light panel
+MOISTURE_PANEL = {
+    **PLANT_PANEL,
+    "datasource": MOISTURE_QUERY["datasource"],
+    "fieldConfig": {
+        **PLANT_PANEL["fieldConfig"],
+        "defaults": {
+            **PLANT_PANEL["fieldConfig"]["defaults"],
+            "color": {
+                "mode": "palette-classic"
+            },
+            "displayName": "Plant ${__field.name}"
+        }
+    },
+    "gridPos": {
+        "h": 8,
+        "w": 12,
+        "x": 12,
+        "y": 0
+    },
+    "id": SOURCE_PANEL,
+    "options": {
+        **PLANT_PANEL["options"],
+        "legend": {
+            **PLANT_PANEL["options"]["legend"],
+            "showLegend": True
+        }
+    },
+    "targets": [MOISTURE_QUERY],
+    "transformations": [],
+    "title": "Soil Moisture"
+}
+
+DASHBOARD = {
+    "annotations": {
+        "list": [
+            {
+                "builtIn": 1,
+                "datasource": {
+                    "type": "grafana",
+                    "uid": "-- Grafana --"
+                },
+                "enable": True,
+                "hide": True,
+                "iconColor": "rgba(0, 211, 255, 1)",
+                "name": "Annotations & Alerts",
+                "target": {
+                    "limit": 100,
+                    "matchAny": False,
+                    "tags": [],
+                    "type": "dashboard"
+                },
+                "type": "dashboard"
+            }
+        ]
+    },
+    "editable": True,
+    "fiscalYearStartMonth": 0,
+    "graphTooltip": 0,
+    "id": 1,
+    "links": [],
+    "liveNow": False,
+    "panels": [],
+    "refresh": "5s",
+    "schemaVersion": 37,
+    "style": "dark",
+    "tags": [],
+    "templating": {
+        "list": []
+    },
+    "time": {
+        "from": "now-1m",
+        "to": "now"
+    },
+    "timepicker": {},
+    "timezone": "",
+    "title": "New dashboard",
+    "uid": "47Y9EaJVz",
+    "version": 11,
+    "weekStart": ""
+}
+
+
+PLANT_GROUP_TEMPLATE = Template(PLANT_GROUP)
+PLANT_NODES_TEMPLATE = Template(PLANT_NODES)
+MQTT_OUT_TEMPLATE = Template(MQTT_OUT)
+PLANT_PANEL_TEMPLATE = Template(PLANT_PANEL)
+DASHBOARD_TEMPLATE = Template({**DASHBOARD, "panels": "${panels}"})
+HISTORY_JSON = json.dumps(HISTORY, separators=(',', ':'), ensure_ascii=False)
+HISTORY_GROUP_JSON = json.dumps(HISTORY_GROUP, separators=(',', ':'), ensure_ascii=False)
+STATIC_PANELS_JSON = [json.dumps(panel, separators=(',', ':'), ensure_ascii=False) for panel in STATIC_PANELS]
+MOISTURE_PANEL_JSON = json.dumps(MOISTURE_PANEL, separators=(',', ':'), ensure_ascii=False)
+
+
+# json of {"nodes": [...], "configs": [...]} for the "Moisture" tab
+def render_flow(plants):
+    values = [plant_values(i) for i in range(1, plants + 1)]
+    # every plant renders a list of nodes, its brackets are dropped to join them in a single list
+    nodes = [PLANT_NODES_TEMPLATE.render(**v)[1:-1] for v in values]
+    nodes.append(MQTT_OUT_TEMPLATE.render(y=(60 + 150 * plants + 1000) / 2))
+    nodes.append(HISTORY_JSON)
+    configs = [PLANT_GROUP_TEMPLATE.render_all(values), HISTORY_GROUP_JSON] if plants else [HISTORY_GROUP_JSON]
+    return f'{{"nodes":[{",".join(nodes)}],"configs":[{",".join(configs)}]}}'
+
+
+# json of the dashboard with the static panels, the moisture panel and one panel per plant
+def render_dashboard(plants):
+    panels = list(STATIC_PANELS_JSON)
+    if plants:
+        panels.append(MOISTURE_PANEL_JSON)
+        panels.append(PLANT_PANEL_TEMPLATE.render_all(plant_values(i) for i in range(1, plants + 1)))
+    return DASHBOARD_TEMPLATE.render(panels=f'[{",".join(panels)}]')